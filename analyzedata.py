@@ -1,58 +1,229 @@
 import os
-from properties import dbpath
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from properties import dbpath, incrementalingest, qualityanalysis, clonecachesize, violationcachesize, analysisworkers, metricspath
 from libs.dbmanager import DBManager
 from libs.codeanalysis import extract_commit_features
 from libs.utils import detect_language
-from libs.codequality import get_block_violations
+from libs.codequality import get_block_violations, get_commit_violations
+from libs.metrics import metrics
 
-# Connect to database
-dbmanager = DBManager(dbpath)
+# Define the directory for temporary files (each analysis process uses its own subdirectory)
+tempdir = "./temp_files"
 
-# Create a directory for temporary files
-temp_dir = "./temp_files"
-os.makedirs(temp_dir, exist_ok=True) 
+# Define the caches of the analysis: (name, size in MB)
+caches = [
+	('clones', clonecachesize), # Results of the code clone detection, so that the same file and code block are not compared again
+	('violations', violationcachesize), # Quality violations, so that identical code is checked once
+]
 
-print("\nAnalyzing data")
+# Create dictionary to store the state of the analysis process: its temporary directory, database connection and caches (see `init_worker`)
+worker = {}
 
-print("Extracting commit features")
-# Get all chatgpt links that relate to commits
-for l, link in enumerate(dbmanager.db['links'].find({'MentionedSource': 'commit'}, {'_id': False})):
+def init_worker(dbmanager=None):
+	"""
+	Initializes an analysis process. Each process gets its own subdirectory for the temporary files, because the code
+	clone detection writes them with fixed names, and its own database connection for the caches.
 
-	# Get the commit object
-	commit = dbmanager.db['commits'].find_one({'URL': link['MentionedURL']})
+	:param dbmanager: The `DBManager` to use. If None, a new connection is opened (for the processes of the parallel mode).
+	"""
+
+	# The processes of the parallel mode inherit the metrics of the main process, so start them without those metrics,
+	# that would otherwise be added again to the main process with the metrics of the first analyzed commit
+	if dbmanager is None:
+		metrics.snapshot()
+
+	worker['TempDir'] = tempfile.mkdtemp(dir=tempdir)
+	worker['DBManager'] = dbmanager or DBManager(dbpath)
+	worker['Caches'] = {
+		name: worker['DBManager'].get_cache(name, int(size) * 1024 * 1024) if size else None
+		for name, size in caches
+	}
+
+
+def analyze_commit(commit):
+	"""
+	Analyzes a commit (language detection, code clone detection and quality violations analysis) in the current analysis process.
+
+	:param commit: A dictionary that contains informations about the commit
+	:returns: A tuple containing the commit's _id, the list of `$set` updates of the commit,
+	and the metrics of the analysis (see `Metrics.snapshot`), to be added to the metrics of the main process.
+	"""
+
+	with metrics.item(commit['URL']):
+		updates = analyze_commit_features(commit)
+	return commit['_id'], updates, metrics.snapshot()
+
+
+def analyze_commit_features(commit):
+	"""
+	Detects the language, the code clones and the quality violations of a commit (see `analyze_commit`).
+
+	:returns: The list of `$set` updates of the commit.
+	"""
+
+	clonecache = worker['Caches']['clones']
+	violationcache = worker['Caches']['violations']
+
+	updates = []
 
 	# Call function to detect the programming language
-	language, updatedsharing = detect_language(commit)
+	with metrics.time('language_detection'):
+		language, updatedsharing = detect_language(commit)
 
 	# If language was identified, save it to db
 	if language:
-		dbmanager.update('commits', {'_id': commit['_id']}, {'$set': {'Language': language}})
+		updates.append({'$set': {'Language': language}})
 
 	# If information about generated code blocks was modified (entries from repo: tisztamo/Junior), update the db
 	if updatedsharing:
 		commit['ChatgptSharing'][0] = updatedsharing
 		# Define the query to update ChatgptSharing to db
-		query = {'$set': {f'ChatgptSharing.{0}': updatedsharing}}
-		dbmanager.update('commits', {'_id': commit['_id']}, query)
+		updates.append({'$set': {f'ChatgptSharing.{0}': updatedsharing}})
+
+	# In batch quality analysis mode, check all the JavaScript code of the commit with a single PMD run
+	# If the violations are cached, check only the generated JavaScript code blocks that are not cached
+	# (the committed files are only checked if a code clone is found in them, using the cache as well)
+	precomputed = None
+	if qualityanalysis == 'pmd-batch' or violationcache:
+		with metrics.time('quality_analysis'):
+			precomputed = get_commit_violations(commit, violationcache)
+		# If quality analysis finished with error, check each code separately
+		if precomputed == -1:
+			precomputed = None
 
 	# Call function to extract the analysis features of the commit
-	features = extract_commit_features(commit, temp_dir)
+	features = extract_commit_features(commit, worker['TempDir'], precomputed, clonecache, violationcache)
 	# Add commit's features to the database
-	dbmanager.update('commits', {'_id': commit['_id']}, {'$set': {'AnalysisFeatures': features}})
+	updates.append({'$set': {'AnalysisFeatures': features}})
 
 	# Add attribute to the local variable of the commit
 	commit['AnalysisFeatures'] = features
 
 	# Call function to calculate the quality violations for every generated code block in the shared conversation link
-	commitsharing = get_block_violations(commit)
+	with metrics.time('quality_analysis'):
+		commitsharing = get_block_violations(commit, precomputed)
 
 	# If quality analysis finished sucessfully, update the db
 	if commitsharing != -1:
-		query = {'$set': {f'ChatgptSharing.{0}': commitsharing}}
-		dbmanager.update('commits', {'_id': commit['_id']}, query)
+		updates.append({'$set': {f'ChatgptSharing.{0}': commitsharing}})
+
+	return updates
+
+
+def analyze_commits_parallel(commits, workers):
+	"""
+	Analyzes the commits concurrently, using a pool of `workers` processes that take the commits from a shared queue.
+	A bounded number of commits is queued at a time, so that the commits are not all loaded in memory.
+
+	:param commits: An iterable of dictionaries, each representing one commit.
+	:param workers: An integer specifying the number of worker processes.
+	:returns: A generator of the results of `analyze_commit`, in the order the analyses finish.
+	"""
+
+	with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+		in_flight = set()
+		commits = iter(commits)
+
+		while True:
+			while len(in_flight) < 2 * workers:
+				commit = next(commits, None)
+				if commit is None:
+					break
+				in_flight.add(executor.submit(analyze_commit, commit))
+
+			if not in_flight:
+				break
+
+			done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+			for future in done:
+				yield future.result()
+
+
+def iter_commits(dbmanager, chunksize=1000):
+	"""
+	Returns a generator of the commits that relate to chatgpt links and need to be analyzed. The commits are fetched
+	in bulk, with one query for every `chunksize` links, and only with the fields needed for the analysis.
+	A commit mentioned by many links is analyzed once. In incremental mode, the commits that did not change since 
+	the previous snapshot (still have their analysis) are skipped. Commits without downloaded content are skipped.
+	"""
+
+	# Define the query and the projection of the commits to analyze
+	# The commits whose content was not downloaded (e.g. after a failed download) cannot be analyzed
+	commitfilter = {'CommitContent': {'$exists': True}}
+	if incrementalingest:
+		commitfilter['AnalysisFeatures'] = {'$exists': False}
+	projection = {'URL': True, 'Sha': True, 'RepoName': True, 'ChatgptSharing': True, 'CommitContent.files.filename': True, 'CommitContent.files.patch': True}
+
+	# Get all chatgpt links that relate to commits
+	links = dbmanager.db['links'].find({'MentionedSource': 'commit'}, {'_id': False, 'MentionedURL': True})
+	analyzedurls = set()
+
+	while True:
+		urls = []
+		for link in links:
+			if link['MentionedURL'] not in analyzedurls:
+				analyzedurls.add(link['MentionedURL'])
+				urls.append(link['MentionedURL'])
+			if len(urls) == chunksize:
+				break
+
+		if not urls:
+			break
+
+		# Get the commit objects of the links, in the order of the links
+		commits = {commit['URL']: commit for commit in dbmanager.db['commits'].find({**commitfilter, 'URL': {'$in': urls}}, projection)}
+		for url in urls:
+			if url in commits:
+				yield commits[url]
+
+
+if __name__ == "__main__":
+
+	# Connect to database
+	dbmanager = DBManager(dbpath)
+
+	# Create a directory for temporary files
+	os.makedirs(tempdir, exist_ok=True)
+
+	print("\nAnalyzing data")
+
+	print("Extracting commit features")
+	# Buffer the updates of the commits collection, and write them in bulk
+	commitswriter = dbmanager.bulk_writer('commits')
+
+	# Analyze the commits in this process, or in parallel using `analysisworkers` processes
+	if analysisworkers:
+		# Create the caches before starting the processes, so that they do not all try to create them
+		for name, size in caches:
+			if size:
+				dbmanager.get_cache(name, int(size) * 1024 * 1024)
+		results = analyze_commits_parallel(iter_commits(dbmanager), int(analysisworkers))
+	else:
+		init_worker(dbmanager)
+		results = map(analyze_commit, iter_commits(dbmanager))
+
+	# Write the updates of each analyzed commit, and add the metrics of its analysis
+	try:
+		for commit_id, updates, commitmetrics in results:
+			for update in updates:
+				commitswriter.update({'_id': commit_id}, update)
+			metrics.merge(commitmetrics)
+	finally:
+		# Write the remaining updates, also when the analysis of a commit failed, so that the analyzed commits are kept
+		commitswriter.flush()
+
+	for name, size in caches:
+		if size:
+			print(f"Cache '{name}': {metrics.counters.get('cache_hits', {}).get(name, 0)} hits, {metrics.counters.get('cache_misses', {}).get(name, 0)} misses")
+
+	# Export the metrics of the run
+	if metricspath:
+		print("Metrics written to " + ", ".join(metrics.export(metricspath, 'analyzedata')))
 
-# Remove the directory with temporary files
-os.rmdir(temp_dir)
+	# Remove the directory with temporary files
+	shutil.rmtree(tempdir)
 
-# Close the DB connection
-dbmanager.close()
+	# Close the DB connection
+	dbmanager.close()
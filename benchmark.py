@@ -0,0 +1,205 @@
+import os
+import csv
+import copy
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from libs import codeanalysis, codequality, utils
+from libs.synthetic import generate_snapshot, generate_commit_content, write_stub_tools
+from libs.preprocessing import get_subpath, contains_invalid_chars, collection_preprocessing, links_preprocessing, remove_duplicates
+from libs.utils import get_content_from_patch, parse_patch, get_file_extension, detect_language
+from libs.codeanalysis import extract_clone_details, detect_code_clone, normalize_lines, find_duplicate_runs
+
+""" Benchmark the preprocessing and the analysis functions on a synthetic DevGPT snapshot (see `libs.synthetic`) """
+
+# Define the snapshot collections: (snapshot file, type of data)
+collections = [
+	('discussion', "discussion"),
+	('pr', "pull-req"),
+	('issue', "issue"),
+	('commit', "commit"),
+	('file', "file"),
+	('hn', "hacker-news"),
+]
+
+# Create list to store the results of the benchmarks: (name, number of items, timings of the rounds in seconds)
+results = []
+
+def benchmark(name, func, items, rounds, setup=None):
+	"""
+	Times a function for a number of rounds, and stores the timings to `results`.
+
+	:param name: The name of the benchmark.
+	:param func: The function to time. It is called with the value returned by `setup`, if any.
+	:param items: An integer specifying the number of items processed by each call, to report the time per item.
+	:param rounds: An integer specifying the number of rounds.
+	:param setup: A function called before each round, that is not timed (e.g. to copy data that `func` modifies).
+	"""
+
+	timings = []
+	for _ in range(rounds):
+		args = (setup(),) if setup else ()
+		start = time.perf_counter()
+		func(*args)
+		timings.append(time.perf_counter() - start)
+	results.append((name, items, timings))
+	print(f"{name}: {min(timings):.4f}s")
+
+
+def print_results():
+	"""
+	Prints the timings of the benchmarks (min, max, mean, standard deviation, median and mean time per item), as pytest-benchmark does.
+	"""
+
+	header = f"{'Name':<38} {'Min (s)':>10} {'Max (s)':>10} {'Mean (s)':>10} {'StdDev':>10} {'Median':>10} {'Items':>8} {'Per item (us)':>14}"
+	print("\n" + header + "\n" + "-" * len(header))
+	for name, items, timings in results:
+		mean = statistics.mean(timings)
+		stddev = statistics.stdev(timings) if len(timings) > 1 else 0
+		print(f"{name:<38} {min(timings):>10.4f} {max(timings):>10.4f} {mean:>10.4f} {stddev:>10.4f} {statistics.median(timings):>10.4f} {items:>8} {mean / max(items, 1) * 1e6:>14.1f}")
+
+
+def get_texts(sources):
+	"""
+	Returns the text fields of the sources, that are checked for invalid characters by the preprocessing.
+	"""
+
+	texts = []
+	for source in sources:
+		texts.extend(source[field] for field in ('Title', 'Body', 'Message', 'CommitMessage') if source.get(field))
+		for sharing in source['ChatgptSharing']:
+			for conversation in sharing['Conversations']:
+				texts.append(conversation['Prompt'])
+				texts.append(conversation['Answer'])
+				texts.extend(code['Content'] for code in conversation['ListOfCode'])
+	return texts
+
+
+def get_clone_inputs(commits):
+	"""
+	Returns the inputs of the code clone detection for the committed files of the commits: (content, code blocks, extension).
+	"""
+
+	inputs = []
+	for commit in commits:
+		codeblocks = [code['Content'] for conversation in commit['ChatgptSharing'][0]['Conversations'] for code in conversation['ListOfCode']]
+		for file in commit['CommitContent']['files']:
+			file_extension = get_file_extension(file['filename'])
+			if file_extension:
+				inputs.append((get_content_from_patch(file['patch'], 'current'), codeblocks, file_extension[1:]))
+	return inputs
+
+
+def get_simian_duplicates(clone_inputs):
+	"""
+	Returns the inputs of `extract_clone_details`: the code files and the duplicates between them and their code blocks, as reported by Simian.
+	"""
+
+	inputs = []
+	for content, codeblocks, _ in clone_inputs:
+		lines = normalize_lines(content)
+		for code_block in codeblocks:
+			blocklines = normalize_lines(code_block)
+			duplicates = ["Similarity Analyser 4.0.0\n"]
+			for start1, start2, length in find_duplicate_runs(lines, blocklines, 1):
+				duplicates.append(
+					f" {length} duplicate lines in the following files:\n"
+					f" Between lines {lines[start1][0] + 1} and {lines[start1 + length - 1][0] + 1} in ./temp_files/file_code.js\n"
+					f" Between lines {blocklines[start2][0] + 1} and {blocklines[start2 + length - 1][0] + 1} in ./temp_files/chat_code.js\n"
+				)
+			if len(duplicates) > 1:
+				inputs.append((content, duplicates))
+	return inputs
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--sources', type=int, default=1000, help="total number of sources of the synthetic snapshot (e.g. 10**3 to 10**6)")
+	parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic snapshot")
+	parser.add_argument('--rounds', type=int, default=5, help="number of rounds of each benchmark")
+	parser.add_argument('--dataset', help="folder to keep the synthetic dataset (by default, a temporary folder that is removed)")
+	parser.add_argument('--stub-tools', action='store_true', help="also benchmark the Simian and PMD paths, using stubs of the tools")
+	parser.add_argument('--tool-commits', type=int, default=50, help="number of commits used for the Simian and PMD paths")
+	args = parser.parse_args()
+
+	datasetpath = args.dataset or tempfile.mkdtemp()
+
+	print(f"\nGenerating a synthetic snapshot of {args.sources} sources")
+	start = time.perf_counter()
+	counts = generate_snapshot(datasetpath, args.sources, args.seed)
+	snapshotpath = os.path.join(datasetpath, "snapshot_20230914")
+	print(f"Generated {counts} in {time.perf_counter() - start:.2f}s")
+
+	# Load the snapshot, as populatedb does
+	loaded = {}
+	for datatype, sourcetype in collections:
+		with open(get_subpath(snapshotpath, datatype), 'r', encoding='utf-8') as infile:
+			loaded[sourcetype] = json.load(infile)
+	with open(get_subpath(snapshotpath, 'Link'), 'r', encoding='utf-8') as infile:
+		links = list(csv.DictReader(infile))
+
+	commits, duplicatelinks = remove_duplicates(loaded["commit"]['Sources'], 'Sha')
+	rng = random.Random(args.seed)
+	for commit in commits:
+		commit['CommitContent'] = generate_commit_content(rng, commit)
+
+	print("\nRunning the benchmarks")
+
+	# --- Preprocessing ---
+	texts = get_texts(source for data in loaded.values() for source in data['Sources'])
+	benchmark("contains_invalid_chars", lambda: [contains_invalid_chars(text) for text in texts], len(texts), args.rounds)
+
+	linkstodrop = set()
+	for datatype, sourcetype in collections:
+		data = loaded[sourcetype]
+		benchmark(f"collection_preprocessing[{sourcetype}]", lambda data: collection_preprocessing(data, sourcetype, set()), len(data['Sources']), args.rounds, lambda: copy.deepcopy(data))
+		collection_preprocessing(data, sourcetype, linkstodrop)
+
+	benchmark("links_preprocessing", lambda duplicates: links_preprocessing(links, linkstodrop, duplicates), len(links), args.rounds, lambda: list(duplicatelinks))
+
+	# --- Analysis ---
+	patches = [file['patch'] for commit in commits for file in commit['CommitContent']['files']]
+	benchmark("get_content_from_patch", lambda: [get_content_from_patch(patch, version) for patch in patches for version in ('current', 'previous')], 2 * len(patches), args.rounds)
+	benchmark("parse_patch", lambda: [parse_patch(patch) for patch in patches], len(patches), args.rounds)
+
+	# The filename table is loaded once, before the timer, and the extension of each filename is memoized, so each round starts without the memoized extensions
+	utils.load_extension_table()
+	filenames = [file['filename'] for commit in commits for file in commit['CommitContent']['files']]
+	benchmark("get_file_extension", lambda _: [get_file_extension(filename) for filename in filenames], len(filenames), args.rounds, utils.file_extensions.clear)
+
+	benchmark("detect_language", lambda commits: [detect_language(commit) for commit in commits], len(commits), args.rounds, lambda: copy.deepcopy(commits))
+
+	clone_inputs = get_clone_inputs(commits)
+	simian_duplicates = get_simian_duplicates(clone_inputs)
+	benchmark("extract_clone_details", lambda: [extract_clone_details(content, duplicates) for content, duplicates in simian_duplicates], len(simian_duplicates), args.rounds)
+
+	tempdir = tempfile.mkdtemp(dir=datasetpath)
+	codeanalysis.clonedetection = 'python'
+	benchmark("detect_code_clone[python]", lambda: [detect_code_clone(*clone_input, 1, tempdir) for clone_input in clone_inputs], len(clone_inputs), args.rounds)
+
+	# --- Simian and PMD paths, with stubs of the tools ---
+	if args.stub_tools:
+		codeanalysis.java, codequality.pmd = write_stub_tools(os.path.join(datasetpath, "stubs"))
+		codeanalysis.simian = "simian.jar"
+		tool_commits = commits[:args.tool_commits]
+		tool_clone_inputs = get_clone_inputs(tool_commits)
+
+		for mode in ('simian', 'simian-batch'):
+			codeanalysis.clonedetection = mode
+			benchmark(f"detect_code_clone[{mode}]", lambda: [detect_code_clone(*clone_input, 1, tempdir) for clone_input in tool_clone_inputs], len(tool_clone_inputs), args.rounds)
+
+		for mode in ('pmd', 'pmd-batch'):
+			codequality.qualityanalysis = mode
+			benchmark(f"get_commit_violations[{mode}]", lambda: [codequality.get_commit_violations(commit) for commit in tool_commits], len(tool_commits), args.rounds)
+
+	print_results()
+
+	if not args.dataset:
+		shutil.rmtree(datasetpath)
+	else:
+		shutil.rmtree(tempdir)
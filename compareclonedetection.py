@@ -0,0 +1,61 @@
+import os
+from properties import dbpath
+from libs.dbmanager import DBManager
+from libs import codeanalysis
+from libs.utils import get_content_from_patch, get_file_extension
+
+""" Compare the in-process code clone detection with Simian, on the committed files of the dataset """
+
+# Connect to database
+dbmanager = DBManager(dbpath)
+
+# Create a directory for temporary files
+temp_dir = "./temp_files"
+os.makedirs(temp_dir, exist_ok=True)
+
+compared = 0
+mismatches = []
+
+# Get all commits that relate to chatgpt links
+for link in dbmanager.db['links'].find({'MentionedSource': 'commit'}, {'_id': False}):
+	commit = dbmanager.db['commits'].find_one({'URL': link['MentionedURL']})
+	if not commit or 'files' not in commit.get('CommitContent', {}):
+		continue
+
+	codeblocks = [
+		code['Content']
+		for conversation in commit['ChatgptSharing'][0]['Conversations']
+		for code in conversation['ListOfCode']
+	]
+
+	for file in commit['CommitContent']['files']:
+		file_extension = get_file_extension(file['filename'])
+		if not file_extension or 'patch' not in file:
+			continue
+		content = get_content_from_patch(file['patch'], 'current')
+
+		# Detect the code clones with both engines
+		codeanalysis.clonedetection = 'simian'
+		simian_clone = codeanalysis.detect_code_clone(content, codeblocks, file_extension[1:], 1, temp_dir)
+		if simian_clone == -1:
+			continue
+		codeanalysis.clonedetection = 'python'
+		python_clone = codeanalysis.detect_code_clone(content, codeblocks, file_extension[1:], 1, temp_dir)
+
+		compared += 1
+		simian_result = (simian_clone.get('DuplicateLines', 0), simian_clone.get('BlockIdx', 0) if simian_clone.get('DuplicateLines') else 0)
+		python_result = (python_clone.get('DuplicateLines', 0), python_clone.get('BlockIdx', 0) if python_clone.get('DuplicateLines') else 0)
+		if simian_result != python_result:
+			mismatches.append((commit['URL'], file['filename'], simian_result, python_result))
+
+# Print the results
+print(f"\nCompared files: {compared}")
+print(f"Agreement (DuplicateLines, BlockIdx): {compared - len(mismatches)}/{compared}")
+for url, filename, simian_result, python_result in mismatches:
+	print(f"{url} {filename}: Simian {simian_result}, Python {python_result}")
+
+# Remove the directory with temporary files
+os.rmdir(temp_dir)
+
+# Close the DB connection
+dbmanager.close()
@@ -0,0 +1,22 @@
+import sys
+from properties import dbpath, resultstablespath
+from libs.dbmanager import DBManager
+from libs.resultstables import export_tables
+
+""" Export the analysis results to columnar tables, so that the results can be generated without the database """
+
+# The generateresults_rq*.py scripts read the tables from the same folder, so it has to be set explicitly
+if not resultstablespath:
+	sys.exit("Set the RESULTSTABLESPATH variable in the .env file to the folder where the results tables should be saved")
+
+# Connect to database
+dbmanager = DBManager(dbpath)
+
+# Export the commits, committed files and generated code blocks tables
+print("\nExporting results tables")
+rows = export_tables(dbmanager.db, resultstablespath)
+for name, count in rows.items():
+	print(f"{name}: {count} rows")
+
+# Close the DB connection
+dbmanager.close()
@@ -1,12 +1,10 @@
-import json
-from collections import defaultdict
+from properties import dbpath
+from libs.dbmanager import DBManager
 
 """ Calculate the Conversation Category Distribution of the Dataset """
 
-# Load annotations from file
-with open('annotations.txt', 'r') as file:
-	# Load the JSON data from the file into a dictionary
-	annotations = json.load(file)
+# Connect to database
+dbmanager = DBManager(dbpath)
 
 # Define a dictionary matching each annotation number with a scenario category	
 annotationmatch = {
@@ -18,12 +16,13 @@ annotationmatch = {
 	"4": "Explain this code", 
 	"5": "Other" }
 
-# Define a dictionary to store the annotation category and the number of its occurencies
-annotations_counts = defaultdict(int)
-
-# Count the number of occurencies of each category
-for annotationnum in annotations.values():   
-	annotations_counts[annotationmatch[annotationnum]] += 1
+# Count the number of occurencies of each category, in the annotated commits (stored by `populatedb.py`)
+pipeline = [
+	{'$match': {'Annotation': {'$exists': True}}},
+	{'$group': {'_id': '$Annotation', 'Count': {'$sum': 1}}},
+	{'$sort': {'_id': 1}},
+]
+annotations_counts = {annotationmatch[category['_id']]: category['Count'] for category in dbmanager.db['commits'].aggregate(pipeline)}
 
 # Sort categories by the number of occurrences
 sorted_categories = sorted(annotations_counts.keys(), key=lambda x: annotations_counts[x], reverse=True)
@@ -33,3 +32,6 @@ sorted_occurrences = [annotations_counts[category] for category in sorted_catego
 print("\nConversation Category Distribution of the Dataset:\n")
 for category, count in zip(sorted_categories, sorted_occurrences):
     print(f"{category}: {count}")
+
+# Close the DB connection
+dbmanager.close()
@@ -0,0 +1,49 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from properties import dbpath, resultspath, resultstablespath
+from libs.dbmanager import DBManager
+from libs.resultstables import scan_tables, load_tables
+from libs.figures import get_rq1_data, get_rq2_data, get_rq3_data, plot_rq1, plot_rq2, plot_rq3
+
+""" Generate the diagrams of the research questions with a single pass over the data, e.g. `python generateresults.py rq1 rq3` (all by default) """
+
+# Define the research questions: name -> (function computing its data from the results tables, function generating its figures)
+researchquestions = {
+	'rq1': (get_rq1_data, plot_rq1),
+	'rq2': (get_rq2_data, plot_rq2),
+	'rq3': (get_rq3_data, plot_rq3),
+}
+
+if __name__ == "__main__":
+
+	# Get the research questions to generate
+	selected = sys.argv[1:] or list(researchquestions)
+	unknown = [name for name in selected if name not in researchquestions]
+	if unknown:
+		sys.exit(f"Unknown research questions: {', '.join(unknown)} (available: {', '.join(researchquestions)})")
+
+	# Create a folder to store the results if it doesn't exist
+	results_folder = resultspath
+	os.makedirs(results_folder, exist_ok=True)
+
+	# If the results were exported (see `exportresults.py`), use the results tables instead of the database
+	if resultstablespath:
+		results_tables = load_tables(resultstablespath)
+	else:
+		# Build the results tables with a single pass over the commits collection
+		dbmanager = DBManager(dbpath)
+		results_tables = scan_tables(dbmanager.db)
+		dbmanager.close()
+
+	# Compute the data of each research question, and generate its figures in a separate process
+	with ProcessPoolExecutor(max_workers=len(selected)) as executor:
+		futures = {}
+		for name in selected:
+			get_data, plot = researchquestions[name]
+			data = get_data(results_tables)
+			futures[name] = executor.submit(plot, *(data if isinstance(data, tuple) else (data,)), results_folder)
+
+		for name, future in futures.items():
+			future.result()
+			print(f"Generated the figures of {name.upper()}")
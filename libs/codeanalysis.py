@@ -1,9 +1,10 @@
 import subprocess
 import re
 import os
-from properties import java, simian
-from libs.utils import get_content_from_patch, get_file_extension
+from properties import java, simian, clonedetection
+from libs.utils import get_parsed_patch, get_file_extension
 from libs.codequality import get_file_violations
+from libs.metrics import metrics
 
 def extract_clone_details(code_file, best_match_duplicates):
 	"""
@@ -49,10 +50,273 @@ def extract_clone_details(code_file, best_match_duplicates):
 	return code_clone, final_lines_cloned
 
 
-def detect_code_clone(code_file, chatgpt_code_blocks, file_extension, min_lines, temp_dir):
+def compare_code_block_simian(file_path1, file_content, code_block, file_extension, min_lines, temp_dir):
+	"""
+	This function detects code clones between a code file and one code block using the Simian tool.
+	
+	:param file_path1: A string containing the path of the temporary file with the content of the code file
+	:param file_content: A string containing the content of the code file, as written to the temporary file
+	:param code_block: A string containing the code block
+	:param file_extension: A string that represents the file extension of the code file.
+	:param min_lines: An integer specifying the minimum number of lines that a code clone must have
+	:param temp_dir: A string that specifies the directory where temporary files will be stored
+	:returns: A dictionary with the number of the file's lines that were cloned (`DuplicateLines`) and the exact lines 
+	(`CloneDetails`), or an empty dictionary if no code clone was found. If Simian finished with error, return (-1)
+	"""
+
+	# Write the code block to the temporary file
+	file_path2 = os.path.join(temp_dir, f"./chat_code{file_extension}")
+	with open(file_path2, 'w', encoding='cp437', errors="ignore") as file2:
+		file2.write(code_block)
+
+	# Define the Simian command
+	cpd_command = f'"{java}" -jar "{simian}" -defaultLanguage=text -threshold={min_lines} {file_path1} {file_path2}'
+
+	# Run the command and capture the output
+	metrics.count('subprocesses', 'simian')
+	with metrics.time('simian'):
+		output = subprocess.run(cpd_command, shell=True, text=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	os.remove(file_path2)
+
+	# If simian finished with error
+	if output.returncode == 2:
+		print("Error using Simian tool.")
+		return -1
+
+	# If no code clones detected
+	elif output.returncode == 0:
+		return {}
+
+	# Decode the output using utf-8
+	stdout_str = output.stdout.decode('utf-8')
+	
+	duplicates_found = stdout_str.split('Found')
+	duplicate_lines = 0
+	# Define a regular expression pattern to capture the number of lines from info
+	line_num_pattern = r'(\d+) duplicate lines'
+
+	# Get duplicates found between the two temporaty files. (Do not include the duplicated code within the same file)
+	for duplicate in duplicates_found[1:-1].copy():
+		# Check if duplicate refers to both files
+		if 'file_code' in duplicate and 'chat_code' in duplicate:
+			info_lines = [line.strip() for line in duplicate.splitlines()]
+			match = re.search(line_num_pattern, info_lines[0])
+			duplicate_lines += (int(match.group(1)) + 1)
+		else:
+			duplicates_found.remove(duplicate)
+
+	# If clone found, extract its info
+	if duplicates_found and duplicate_lines > 0:
+		clone_details, actual_lines_cloned = extract_clone_details(file_content, duplicates_found)
+		return {'DuplicateLines': actual_lines_cloned, 'CloneDetails': clone_details}
+
+	return {}
+
+
+def get_duplicate_files(duplicate):
+	"""
+	This function extracts the names of the files that contain a duplicate code block, reported by Simian.
+	
+	:param duplicate: A string containing the information about one duplicate code block, reported by Simian.
+	:returns: A set with the names (without the directory) of the files that contain the duplicate code block.
+	"""
+
+	return {
+		os.path.basename(match.group(1).strip())
+		for match in re.finditer(r'Between lines \d+ and \d+ in (.+)', duplicate)
+	}
+
+
+def compare_code_blocks_simian_batch(file_path1, file_content, code_blocks, file_extension, min_lines, temp_dir):
+	"""
+	This function detects code clones between a code file and many code blocks with a single Simian run. 
+	All code blocks are written to separate temporary files, and each duplicate reported by Simian 
+	is then attributed back to the code block(s) it was found in.
+	
+	:param file_path1: A string containing the path of the temporary file with the content of the code file
+	:param file_content: A string containing the content of the code file, as written to the temporary file
+	:param code_blocks: A dictionary mapping the index of each code block to its content
+	:param file_extension: A string that represents the file extension of the code file.
+	:param min_lines: An integer specifying the minimum number of lines that a code clone must have
+	:param temp_dir: A string that specifies the directory where temporary files will be stored
+	:returns: A dictionary mapping the index of each code block to its result (see `compare_code_block_simian`).
+	If Simian finished with error, return (-1)
+	"""
+
+	results = {idx: {} for idx in code_blocks}
+	if not code_blocks:
+		return results
+
+	# Create a temporary file for each code block
+	block_paths = {}
+	for idx, code_block in code_blocks.items():
+		block_path = os.path.join(temp_dir, f"chat_code_{idx}{file_extension}")
+		with open(block_path, 'w', encoding='cp437', errors="ignore") as file2:
+			file2.write(code_block)
+		block_paths[idx] = block_path
+
+	# Run Simian once, for the code file and all code blocks
+	cpd_command = [java, '-jar', simian, '-defaultLanguage=text', f'-threshold={min_lines}', file_path1] + list(block_paths.values())
+	metrics.count('subprocesses', 'simian')
+	with metrics.time('simian'):
+		output = subprocess.run(cpd_command, text=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+	for block_path in block_paths.values():
+		os.remove(block_path)
+
+	# If simian finished with error
+	if output.returncode == 2:
+		print("Error using Simian tool.")
+		return -1
+
+	# If no code clones detected
+	elif output.returncode == 0:
+		return results
+
+	# Decode the output using utf-8
+	stdout_str = output.stdout.decode('utf-8')
+	duplicates_found = stdout_str.split('Found')
+
+	# Keep only the duplicates between the code file and some code block
+	file_name = os.path.basename(file_path1)
+	duplicates_files = [(duplicate, get_duplicate_files(duplicate)) for duplicate in duplicates_found[1:-1]]
+	duplicates_files = [(duplicate, files) for duplicate, files in duplicates_files if file_name in files]
+
+	# Define a regular expression pattern to capture the number of lines from info
+	line_num_pattern = r'(\d+) duplicate lines'
+
+	# Attribute the duplicates to each code block
+	for idx, block_path in block_paths.items():
+		block_name = os.path.basename(block_path)
+		block_duplicates = [duplicate for duplicate, files in duplicates_files if block_name in files]
+
+		duplicate_lines = 0
+		for duplicate in block_duplicates:
+			match = re.search(line_num_pattern, duplicate.splitlines()[0])
+			duplicate_lines += (int(match.group(1)) + 1)
+
+		# If clone found, extract its info
+		if duplicate_lines > 0:
+			clone_details, actual_lines_cloned = extract_clone_details(file_content, duplicates_found[:1] + block_duplicates)
+			results[idx] = {'DuplicateLines': actual_lines_cloned, 'CloneDetails': clone_details}
+
+	return results
+
+
+def normalize_lines(content):
+	"""
+	This function splits a code file into its significant lines, normalized the way Simian compares them for text files:
+	whitespace and character case are ignored, and empty lines or lines containing only curly braces are skipped.
+	
+	:param content: A string containing the content of a code file.
+	:returns: A list of tuples (line index, normalized line) with the significant lines of the file.
+	"""
+
+	normalized = []
+	for i, line in enumerate(content.splitlines()):
+		line = ''.join(line.split()).lower()
+		if line.strip('{}'):
+			normalized.append((i, line))
+	return normalized
+
+
+def find_duplicate_runs(lines1, lines2, min_lines):
+	"""
+	This function finds the maximal runs of (at least `min_lines`) consecutive significant lines that are
+	identical between two files. Each line is hashed, and the windows of `min_lines` lines of the second file
+	are indexed by a rolling hash, so that matching runs are found without comparing every pair of lines.
+	
+	:param lines1: A list of the normalized significant lines of the first file (see `normalize_lines`).
+	:param lines2: A list of the normalized significant lines of the second file.
+	:param min_lines: An integer specifying the minimum number of lines of a run.
+	:returns: A list of tuples (start1, start2, length) with the start positions of each run in the two lists and its length.
+	"""
+
+	if min_lines < 1 or len(lines1) < min_lines or len(lines2) < min_lines:
+		return []
+
+	base = 1000003
+	modulus = (1 << 61) - 1
+	power = pow(base, min_lines - 1, modulus)
+
+	def window_hashes(lines):
+		hashes = []
+		value = 0
+		for i, (_, line) in enumerate(lines):
+			if i >= min_lines:
+				value = (value - hash(lines[i - min_lines][1]) * power) % modulus
+			value = (value * base + hash(line)) % modulus
+			if i >= min_lines - 1:
+				hashes.append(value)
+		return hashes
+
+	# Index the windows of the second file by their hash
+	windows2 = {}
+	for j, value in enumerate(window_hashes(lines2)):
+		windows2.setdefault(value, []).append(j)
+
+	runs = []
+	for i, value in enumerate(window_hashes(lines1)):
+		for j in windows2.get(value, ()):
+			# Skip windows that are part of a run starting earlier
+			if i > 0 and j > 0 and lines1[i - 1][1] == lines2[j - 1][1]:
+				continue
+			# Verify the match (in case of hash collisions) and extend it as far as possible
+			length = 0
+			while i + length < len(lines1) and j + length < len(lines2) and lines1[i + length][1] == lines2[j + length][1]:
+				length += 1
+			if length >= min_lines:
+				runs.append((i, j, length))
+
+	return runs
+
+
+def compare_code_block_python(file_content, code_block, min_lines):
+	"""
+	This function detects code clones between a code file and one code block in-process, without using Simian (see `find_duplicate_runs`).
+	
+	:param file_content: A string containing the content of the code file
+	:param code_block: A string containing the code block
+	:param min_lines: An integer specifying the minimum number of lines that a code clone must have
+	:returns: A dictionary with the number of the file's lines that were cloned (`DuplicateLines`) and the exact lines 
+	(`CloneDetails`), or an empty dictionary if no code clone was found.
+	"""
+
+	# Keep only the characters that would be written to the temporary files of Simian
+	code_block = code_block.encode('cp437', errors='ignore').decode('cp437')
+	normalized_file = normalize_lines(file_content)
+	runs = find_duplicate_runs(normalized_file, normalize_lines(code_block), min_lines)
+
+	if not runs:
+		return {}
+
+	# Get the lines of the code file between the first and the last line of each run
+	clone_lines = set()
+	for start, _, length in runs:
+		clone_lines.update(range(normalized_file[start][0], normalized_file[start + length - 1][0] + 1))
+
+	file_lines = file_content.splitlines()
+	code_clone_lines = [f"{i+1}: {file_lines[i]}" for i in sorted(clone_lines) if len(file_lines[i].strip()) >= 3]
+	return {'DuplicateLines': len(code_clone_lines), 'CloneDetails': '\n'.join(code_clone_lines)}
+
+
+def get_clone_engine_version():
+	"""
+	This function returns a string identifying the selected code clone detection engine (and its version), used in the keys of the cached results.
+	"""
+
+	if clonedetection == 'python':
+		return 'python-1'
+	return f"{clonedetection}-{os.path.basename(simian or '')}"
+
+
+def detect_code_clone(code_file, chatgpt_code_blocks, file_extension, min_lines, temp_dir, cache=None):
 	"""
 	This function detects code clones between a given code file and a list of code
 	blocks using the Simian tool, and returns information about the code clones, if any are found.
+	The detection engine is selected by `clonedetection`: "simian" runs Simian once for every code block, 
+	"simian-batch" runs Simian once for all code blocks (see `compare_code_blocks_simian_batch`), 
+	and "python" detects the code clones in-process, without Simian (see `compare_code_block_python`).
 	
 	:param code_file: A string containing the content of the code file that you want to check for clones
 	:param chatgpt_code_blocks: A list of code blocks extracted from a Chatgpt conversation. These code
@@ -62,90 +326,91 @@ def detect_code_clone(code_file, chatgpt_code_blocks, file_extension, min_lines,
 	have in order to be considered a match
 	:param temp_dir: A string that specifies the directory where temporary files will be stored. 
 	These temporary files are used to compare the code blocks and detect code clones
+	:param cache: A `ResultCache` storing the results of previous comparisons between a code file and a code block.
+	The cached comparisons are not computed again.
 	:returns: A dictionary that contains information about the best detected code clone found. 
 	The dictionary includes the following keys: (If at least one code clone found. Else the dictionary is empty)
 		- DuplicateLines: An integer specifying the number of lines that were cloned
 		- Ratio: A float representing the percentage of lines of the initial file that were cloned
 		- BlockIdx: An integer representing the index of the code block, where the best clone was found
 		- CloneDetails: A string representing the exact lines of the code file that were cloned. 
+	If simian finished with error, return (-1)
 	"""
 
 	# Initialize a dictionary to store the results information
 	code_clone = {}
 
-	# Create temporary files
-	file_path1 = os.path.join(temp_dir, f"./file_code{file_extension}")
-	with open(file_path1, 'w', encoding='cp437', errors="ignore") as file1:
-		file1.write(code_file)
-
-	file_path2 = os.path.join(temp_dir, f"./chat_code{file_extension}")
-
-	num_blocks = len(chatgpt_code_blocks)
-
-	# For each provided code block
-	for i, code_block in enumerate(reversed(chatgpt_code_blocks)):
-		# Write the code block to the temporary file
-		with open(file_path2, 'w', encoding='cp437', errors="ignore") as file2:
-			file2.write(code_block)
+	# Keep only the characters that are written to the temporary files
+	file_content = code_file.encode('cp437', errors='ignore').decode('cp437')
 
-		# Define the Simian command
-		cpd_command = f'"{java}" -jar "{simian}" -defaultLanguage=text -threshold={min_lines} {file_path1} {file_path2}'
+	# Get the cached results of the comparisons between the code file and each code block, with a single query
+	results = {}
+	cache_keys = {}
+	if cache:
+		engine_version = get_clone_engine_version()
+		for idx, code_block in enumerate(chatgpt_code_blocks, start=1):
+			cache_keys[idx] = cache.get_key(engine_version, min_lines, code_file, code_block)
+		cached = cache.get_many(list(cache_keys.values()))
+		results = {idx: cached[key] for idx, key in cache_keys.items() if key in cached}
 
-		# Run the command and capture the output
-		output = subprocess.run(cpd_command, shell=True, text=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-		# If simian finished with error
-		if output.returncode == 2:
-			print("Error using Simian tool.")
-			return -1
-
-		# If no code clones detected, continue
-		elif output.returncode == 0:
-			continue
-
-		# Decode the output using utf-8
-		stdout_str = output.stdout.decode('utf-8')
-		
-		duplicates_found = stdout_str.split('Found')
-		duplicate_lines = 0
-		# Define a regular expression pattern to capture the number of lines from info
-		line_num_pattern = r'(\d+) duplicate lines'
-
-		# Get duplicates found between the two temporaty files. (Do not include the duplicated code within the same file)
-		for duplicate in duplicates_found[1:-1].copy():
-			# Check if duplicate refers to both files
-			if 'file_code' in duplicate and 'chat_code' in duplicate:
-				info_lines = [line.strip() for line in duplicate.splitlines()]
-				match = re.search(line_num_pattern, info_lines[0])
-				duplicate_lines += (int(match.group(1)) + 1)
+	# Create temporary file
+	file_path1 = os.path.join(temp_dir, f"./file_code{file_extension}")
+	if clonedetection != 'python':
+		with open(file_path1, 'w', encoding='cp437', errors="ignore") as file1:
+			file1.write(code_file)
+
+	# In batch mode, compare the code file with all the remaining code blocks with a single Simian run
+	if clonedetection == 'simian-batch':
+		code_blocks = {idx: code_block for idx, code_block in enumerate(chatgpt_code_blocks, start=1) if idx not in results}
+		batch_results = compare_code_blocks_simian_batch(file_path1, file_content, code_blocks, file_extension, min_lines, temp_dir)
+		if batch_results == -1:
+			code_clone = -1
+		else:
+			for idx, result in batch_results.items():
+				results[idx] = result
+				if cache:
+					cache.put(cache_keys[idx], result)
+
+	# For each provided code block, starting from the latest one
+	for idx in range(len(chatgpt_code_blocks), 0, -1):
+		if code_clone == -1:
+			break
+
+		# Compare the code file with the code block, if not already compared
+		if idx not in results:
+			if clonedetection == 'python':
+				result = compare_code_block_python(file_content, chatgpt_code_blocks[idx - 1], min_lines)
 			else:
-				duplicates_found.remove(duplicate)
+				result = compare_code_block_simian(file_path1, file_content, chatgpt_code_blocks[idx - 1], file_extension, min_lines, temp_dir)
+			# If simian finished with error
+			if result == -1:
+				code_clone = -1
+				break
+			results[idx] = result
+			if cache:
+				cache.put(cache_keys[idx], result)
 
 		# If clone found, extract its info and break loop
-		if duplicates_found and duplicate_lines > 0:
-			# Read the file and print the length and number of lines after writing to a file
-			with open(file_path1, 'r', encoding='cp437') as file:
-				file_content = file.read()
-			clone_details, actual_lines_cloned = extract_clone_details(file_content, duplicates_found)
+		if results[idx]:
+			actual_lines_cloned = results[idx]['DuplicateLines']
 			code_clone['DuplicateLines'] = actual_lines_cloned
 			file_lines = file_content.splitlines()
 			non_empty_lines_num = len([line for line in file_lines if line.strip()])
 			code_clone['Ratio'] = round(actual_lines_cloned / non_empty_lines_num * 100, 1)
-			code_clone['BlockIdx'] = num_blocks - i
+			code_clone['BlockIdx'] = idx
 			# Extract specific lines cloned from the code file
-			code_clone['CloneDetails'] = clone_details
+			code_clone['CloneDetails'] = results[idx]['CloneDetails']
 			if actual_lines_cloned:
 				break
 
-	# Delete the temporary files
-	os.remove(file_path1)
-	if len(chatgpt_code_blocks):
-		os.remove(file_path2)
+	# Delete the temporary file
+	if clonedetection != 'python':
+		os.remove(file_path1)
 
 	return code_clone
 
 
-def extract_commit_features(commit, temp_dir):
+def extract_commit_features(commit, temp_dir, precomputed=None, clonecache=None, violationcache=None):
 	"""
 	This function extracts various features from a commit object, including information 
 	about shared Chatgpt conversation, code clone detection, and
@@ -154,6 +419,10 @@ def extract_commit_features(commit, temp_dir):
 	:param commit: A dictionary that contains informations about the commit
 	:param temp_dir: A string that represents the temporary directory where
 	the code clone detection process will store temporary files
+	:param precomputed: A dictionary mapping code contents to their quality violations, already found by a batch PMD run
+	(see `get_commit_violations`)
+	:param clonecache: A `ResultCache` with the results of previous code clone detections (see `detect_code_clone`)
+	:param violationcache: A `ResultCache` with the quality violations of previously checked contents (see `get_file_violations`)
 	:returns: A dictionary containing various features extracted from the commit.
 	"""
 
@@ -205,8 +474,9 @@ def extract_commit_features(commit, temp_dir):
 
 			file_extension = file_extension[1:]
 
-			# Get file's content from patch (current version)
-			content = get_content_from_patch(file['patch'], 'current')
+			# Get file's content from patch (current version). The patch is parsed once for all analysis steps of the commit
+			parsed_patch = get_parsed_patch(commit.get('Sha'), file)
+			content = parsed_patch['Current']
 
 			# Get all code blocks generated in the specific Chatpgt dialogue
 			codeblocks = [
@@ -217,7 +487,8 @@ def extract_commit_features(commit, temp_dir):
 
 			# Detect copy-pasted code parts (code clones), between the file and the Chatgpt's provided code blocks
 			min_lines = 1
-			code_clone = detect_code_clone(content, codeblocks, file_extension, min_lines, temp_dir)
+			with metrics.time('clone_detection'):
+				code_clone = detect_code_clone(content, codeblocks, file_extension, min_lines, temp_dir, clonecache)
 			
 			# If simian finished with error
 			if code_clone == -1:
@@ -258,8 +529,9 @@ def extract_commit_features(commit, temp_dir):
 					file_features['QualityAnalysis'] = "Language not supported by PMD-check"
 				
 				else:
-					previous_content = get_content_from_patch(file['patch'], 'previous')
-					quality_result = get_file_violations(content, previous_content, file_extension)
+					previous_content = parsed_patch['Previous']
+					with metrics.time('quality_analysis'):
+						quality_result = get_file_violations(content, previous_content, file_extension, precomputed, violationcache)
 
 					# If quality analysis finished with error
 					if quality_result == -1:
@@ -1,14 +1,260 @@
+import os
+import json
+import hashlib
 import tempfile
 import subprocess
-from properties import pmd
+from properties import pmd, qualityanalysis
+from libs.utils import get_parsed_patch, get_file_extension
+from libs.metrics import metrics
 
-def get_file_violations(current_content, prev_content, file_extension):
+# Define the path of the PMD ruleset for javascript
+javascript_ruleset = os.path.join("pmdrulesets", "javascriptruleset.xml")
+
+# Define a dictionary containing the 'name': 'category' of the supported violations for javascript
+javascript_violations = {'GlobalVariable': 'BestPractices',
+							  'AvoidWithStatement': 'BestPractices',
+							  'ConsistentReturn': 'BestPractices', 
+							  'ScopeForInVariable': 'BestPractices',
+							  'UseBaseWithParseInt': 'BestPractices',
+							  'AssignmentInOperand': 'CodeStyle',
+							  'ForLoopsMustUseBraces': 'CodeStyle',
+							  'IfElseStmtsMustUseBraces': 'CodeStyle', 
+							  'IfStmtsMustUseBraces': 'CodeStyle', 
+							  'NoElseReturn': 'CodeStyle', 
+							  'UnnecessaryBlock': 'CodeStyle', 
+							  'UnnecessaryParentheses': 'CodeStyle',
+							  'AvoidTrailingComma': 'ErrorProne',
+							  'EqualComparison': 'ErrorProne',
+							  'InnaccurateNumericLiteral': 'ErrorProne'
+							  }
+
+def get_ruleset_hash():
+	"""
+	This function returns a hash of the content of the PMD ruleset for javascript, so that the cached violations are not used after the ruleset changes.
+	"""
+
+	with open(javascript_ruleset, 'rb') as ruleset_file:
+		return hashlib.sha256(ruleset_file.read()).hexdigest()
+
+
+def get_violation_records(violations):
+	"""
+	This function converts the violations of a file, as reported in PMD's JSON report, to the records stored in the database.
+	
+	:param violations: A list of violations, each a dictionary as reported by PMD (containing e.g. 'rule', 'ruleset', 'beginline', 'description').
+	:returns: A list of dictionaries, one for each violation, with its `Rule`, `Category`, `Line` and `Message`.
+	"""
+
+	return [
+		{
+			'Rule': violation['rule'],
+			'Category': javascript_violations.get(violation['rule'], violation.get('ruleset', '').replace(' ', '')),
+			'Line': violation['beginline'],
+			'Message': violation.get('description', '').strip(),
+		}
+		for violation in violations
+	]
+
+
+def run_pmd(path):
+	"""
+	This function runs a PMD check, with the javascript ruleset, and parses its JSON report.
+	
+	:param path: A string containing the path of the file, or directory of files, to check.
+	:returns: A dictionary mapping the path of each checked file that has violations to its violation records (see `get_violation_records`).
+	If the PMD-check finished with some error code, return (-1)
+	"""
+
+	# Define the PMD check command
+	cpd_command = f"{pmd} check -d {path} -f json --no-cache -R {javascript_ruleset}"
+
+	# Run the command and capture the output
+	metrics.count('subprocesses', 'pmd')
+	with metrics.time('pmd'):
+		output = subprocess.run(cpd_command, shell=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+	# If no quality violations found
+	if output.returncode == 0:
+		return {}
+
+	# If PMD finished with an error code
+	elif output.returncode != 4:
+		return -1
+
+	# If quality violations found, parse the report once
+	report = json.loads(output.stdout)
+	return {file['filename']: get_violation_records(file['violations']) for file in report['files']}
+
+
+def check_violations(content, file_extension):
+	"""
+	This function checks the quality violations of a JavaScript code content using the PMD tool.
+	
+	:param content: A string containing some JavaScript code.
+	:param file_extension: A string that represents the extension of the temporary file, e.g. '.js'
+	:returns: A list with the records of the violations found (see `get_violation_records`). 
+	If the PMD-check finished with some error code, return (-1)
+	"""
+
+	# Create temporary file to store the code's content
+	with tempfile.NamedTemporaryFile(mode='w', delete=False, encoding='cp437', errors="ignore", suffix=file_extension) as temp_file:
+		temp_file.write(content)
+
+	report = run_pmd(temp_file.name)
+	os.remove(temp_file.name)
+
+	if report == -1:
+		return -1
+	return next(iter(report.values()), [])
+
+
+def run_pmd_batch(contents):
+	"""
+	This function checks the quality violations of many JavaScript code contents with a single PMD run. 
+	All contents are written to one temporary directory, and PMD's JSON report is mapped back to each 
+	content by its file path.
+	
+	:param contents: A list of strings, each containing some JavaScript code.
+	:returns: A dictionary mapping each content to the records of the violations found in it (see `get_violation_records`).
+	If the PMD-check finished with some error code, return (-1)
+	"""
+
+	contents = list(dict.fromkeys(contents)) # Analyze identical contents once
+	violations = {content: [] for content in contents}
+	if not contents:
+		return violations
+
+	with tempfile.TemporaryDirectory() as temp_dir:
+		# Create a temporary file for each content
+		file_contents = {}
+		for i, content in enumerate(contents):
+			temp_file_path = os.path.join(temp_dir, f"code{i}.js")
+			with open(temp_file_path, 'w', encoding='cp437', errors="ignore") as temp_file:
+				temp_file.write(content)
+			file_contents[f"code{i}.js"] = content
+
+		# Check the whole directory
+		report = run_pmd(temp_dir)
+
+	# If PMD finished with an error code
+	if report == -1:
+		print('Error in batch quality analysis')
+		return -1
+
+	# Map the violations to the contents by file path
+	for filename, records in report.items():
+		violations[file_contents[os.path.basename(filename)]] = records
+
+	return violations
+
+
+def get_cached_violations(contents, cache=None, batch=False):
+	"""
+	This function checks the quality violations of JavaScript code contents, and uses the cached violations of the contents
+	that were already checked.
+	
+	:param contents: A list of strings, each containing some JavaScript code.
+	:param cache: A `ResultCache` storing the violations of previously checked contents. The cached contents are not checked again, 
+	and the newly checked contents are added to it.
+	:param batch: Boolean. If (True), the contents are checked with a single PMD run (see `run_pmd_batch`), 
+	else PMD is run once for every content (see `check_violations`).
+	:returns: A dictionary mapping each content to the records of the violations found in it (see `get_violation_records`).
+	If the PMD-check finished with some error code, return (-1)
+	"""
+
+	contents = list(dict.fromkeys(contents)) # Analyze identical contents once
+
+	# Get the cached violations, with a single query. The key depends on the format of the records, and the ruleset
+	violations = {}
+	cache_keys = {}
+	if cache:
+		ruleset_hash = get_ruleset_hash()
+		cache_keys = {content: cache.get_key('records', ruleset_hash, content) for content in contents}
+		cached = cache.get_many(list(cache_keys.values()))
+		violations = {content: cached[key] for content, key in cache_keys.items() if key in cached}
+
+	# Check the remaining contents
+	contents = [content for content in contents if content not in violations]
+	if batch:
+		checked = run_pmd_batch(contents)
+		if checked == -1:
+			return -1
+	else:
+		checked = {}
+		for content in contents:
+			checked[content] = check_violations(content, '.js')
+			if checked[content] == -1:
+				return -1
+
+	for content, content_violations in checked.items():
+		violations[content] = content_violations
+		if cache:
+			cache.put(cache_keys[content], content_violations)
+
+	return violations
+
+
+def get_commit_violations(commit, cache=None):
+	"""
+	This function checks the quality violations of the JavaScript code of a commit that may need quality analysis, in advance.
+	If `qualityanalysis` is set to "pmd-batch", all the generated JavaScript code blocks and both versions of the committed
+	JavaScript files are checked with a single PMD run (see `run_pmd_batch`). Else, only the code blocks are checked, 
+	with one PMD run for every code block, because the committed files are only checked if a code clone is found in them 
+	(see `get_file_violations`).
+	
+	:param commit: A dictionary that contains informations about the commit
+	:param cache: A `ResultCache` storing the violations of previously checked contents (see `get_cached_violations`).
+	:returns: A dictionary mapping each code content to the records of the violations found in it (see `get_violation_records`).
+	If the PMD-check finished with some error code, return (-1)
+	"""
+
+	contents = [
+		code['Content']
+		for conversation in commit['ChatgptSharing'][0].get('Conversations', [])
+		for code in conversation['ListOfCode']
+		if code['Type'] == 'javascript'
+	]
+
+	if qualityanalysis == 'pmd-batch':
+		for file in commit.get('CommitContent', {}).get('files', []):
+			file_extension = get_file_extension(file['filename'])
+			if file_extension and file_extension[1:] == '.js' and 'patch' in file:
+				parsed_patch = get_parsed_patch(commit.get('Sha'), file)
+				contents.append(parsed_patch['Current'])
+				contents.append(parsed_patch['Previous'])
+
+	violations = get_cached_violations(contents, cache, qualityanalysis == 'pmd-batch')
+	if violations == -1 and qualityanalysis != 'pmd-batch':
+		print('Error in quality analysis')
+	return violations
+
+
+def count_violations(violations):
+	"""
+	This function counts the supported violations (see `javascript_violations`) of a list of violation records.
+	
+	:param violations: A list of violation records, as returned by `check_violations` or `run_pmd_batch`.
+	:returns: A tuple containing the total number of supported violations, a dictionary with their number by category,
+	and the list of their records.
+	"""
+
+	violations_by_cat = {'BestPractices': 0, 'CodeStyle': 0, 'ErrorProne': 0}
+	supported_violations = [violation for violation in violations if violation['Rule'] in javascript_violations]
+	for violation in supported_violations:
+		violations_by_cat[violation['Category']] += 1
+	return len(supported_violations), violations_by_cat, supported_violations
+
+
+def get_file_violations(current_content, prev_content, file_extension, precomputed=None, cache=None):
 	"""
 	This function checks the quality violations in the current and previous versions of a code file using the PMD tool.
 	
 	:param current_content: A string containing the current version of the code file
 	:param prev_content: A string containing the previous version of the code file
 	:param file_extension: A string that represents the file's extension
+	:param precomputed: A dictionary mapping code contents to their violations, already found by `get_commit_violations`.
+	The contents found in it are not checked again.
+	:param cache: A `ResultCache` storing the violations of previously checked contents (see `get_cached_violations`).
 	:returns: A dictionary that contains the number of quality violations found for each version of the
 	code. The keys of the dictionary are "Current" and "Previous", and the values are the total number
 	of violations found for each version.
@@ -21,131 +267,73 @@ def get_file_violations(current_content, prev_content, file_extension):
 
 	for version, file_content in version_list.items():
 
-		# Create temporary file to store the code file's content
-		with tempfile.NamedTemporaryFile(mode='w', delete=False, encoding='cp437', errors="ignore", suffix=file_extension) as temp_file:
-			temp_file.write(file_content)
-
-		# Get temporary file's path
-		temp_file_path = temp_file.name
-
-		# Create the ruleset relative path according to the file's language
-		ruleset_path = f"pmdrulesets\javascriptruleset.xml"
-
-		# Define the PMD check command
-		cpd_command = f"{pmd} check {temp_file_path} -f text --no-cache -R {ruleset_path}"
-		
-		# Run the command and capture the output
-		output = subprocess.run(cpd_command, shell=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		# If the content was already checked
+		if precomputed and file_content in precomputed:
+			violations[version] = len(precomputed[file_content])
+			continue
 
-		# If quality violations found
-		if output.returncode == 4:
-			# Compute the total number of violations and save it to dictionary
-			output_message = output.stdout
-			total_violations = len(output_message.splitlines())
-			violations[version] = total_violations
+		if cache:
+			file_violations = get_cached_violations([file_content], cache)
+			file_violations = file_violations if file_violations == -1 else file_violations[file_content]
+		else:
+			file_violations = check_violations(file_content, file_extension)
 
-		# If no quality violations found
-		elif output.returncode == 0: 
-			violations[version] = 0
-		
 		# If PMD finished with an error code
-		else:
+		if file_violations == -1:
 			print('Error in before-after quality analysis')
 			return -1
 
+		violations[version] = len(file_violations)
+
 	return violations
 
 
-def get_block_violations(dbobj):
+def get_block_violations(dbobj, precomputed=None):
 	"""
 	This function calculates the number of quality violations in the code blocks of a shared
 	conversation and returns the updated conversation object.
 	
 	:param dbobj: A database object that contains the information about a commit
+	:param precomputed: A dictionary mapping code contents to their violations, already found by `get_commit_violations`.
+	The code blocks found in it are not checked again.
 	:returns: The updated `sharing` object with the added `Violations` attribute for each supported
-	code block in each conversation.
+	code block in each conversation. It contains the number of supported violations (`Total`), their number 
+	by category (`ViolationsByCat`) and their records (`Details`), each with its `Rule`, `Category`, `Line` and `Message`.
 	The function returns (-1) if the PMD finished with error.
 	"""
 
 	# Get the information of the shared conversation
 	sharing = dbobj['ChatgptSharing'][0]
 
-	# Define a dictionary containing the 'name': 'category' of the supported violations for javascript
-	javascript_violations = {'GlobalVariable': 'BestPractices',
-								  'AvoidWithStatement': 'BestPractices',
-								  'ConsistentReturn': 'BestPractices', 
-								  'ScopeForInVariable': 'BestPractices',
-								  'UseBaseWithParseInt': 'BestPractices',
-								  'AssignmentInOperand': 'CodeStyle',
-								  'ForLoopsMustUseBraces': 'CodeStyle',
-								  'IfElseStmtsMustUseBraces': 'CodeStyle', 
-								  'IfStmtsMustUseBraces': 'CodeStyle', 
-								  'NoElseReturn': 'CodeStyle', 
-								  'UnnecessaryBlock': 'CodeStyle', 
-								  'UnnecessaryParentheses': 'CodeStyle',
-								  'AvoidTrailingComma': 'ErrorProne',
-								  'EqualComparison': 'ErrorProne',
-								  'InnaccurateNumericLiteral': 'ErrorProne'
-								  }
-
 	# For every generated code block in every conversation of the shared link, calculate the violations
 	for i, conversation in enumerate(sharing.get('Conversations', [])):
 		# Define variable to specify whether the content of the conversation changed, in order to save it
 		conv_changed = False
 		for j, code in enumerate(conversation['ListOfCode'].copy()):
 
-			# Initialize variables
-			total_violations = 0
-			violations_by_cat = {'BestPractices': 0, 'CodeStyle': 0, 'ErrorProne': 0}
-
 			# If type of code is supported ( JavaScript )
 			if code['Type'] == 'javascript':
 
-				# Create temporary file to store the code file's content
-				with tempfile.NamedTemporaryFile(mode='w', delete=False, encoding='cp437', errors="ignore", suffix='.js') as temp_file:
-					temp_file.write(code['Content'])
-
-				# Get temporary file's path
-				temp_file_path = temp_file.name
-
-				# Create the ruleset relative path according to the file's language
-				ruleset_path = f"pmdrulesets\{code['Type']}ruleset.xml"
-
-				# Define the PMD check command
-				cpd_command = f"{pmd} check {temp_file_path} -f text --no-cache -R {ruleset_path}"
-				
-				# Run the command and capture the output
-				output = subprocess.run(cpd_command, shell=True, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-				# If quality violations found
-				if output.returncode == 4:
-					# Extract the violations by category found and save it to dictionary
-					output_message = output.stdout
-
-					# For each supported violation
-					for name, category in javascript_violations.items():
-						# Check how many times it exist in the output message
-						count = output_message.count(name)
-						if count:
-							total_violations += count
-							violations_by_cat[category] += count
-
-					# Formulate the final dictionary containing the information to be stored to the db
-					code['Violations'] = {'Total': total_violations}
-					code['Violations'].update({'ViolationsByCat': violations_by_cat})
-					conversation['ListOfCode'][j] = code
-					conv_changed = True 
-
-				elif output.returncode == 0:
-					code['Violations'] = {'Total': total_violations}
-					code['Violations'].update({'ViolationsByCat': violations_by_cat})
-					conversation['ListOfCode'][j] = code
-					conv_changed = True
-				
-				# If PMD finished with an error code
+				# If the code block was already checked, use its violations, else check it
+				if precomputed and code['Content'] in precomputed:
+					block_violations = precomputed[code['Content']]
 				else:
+					block_violations = check_violations(code['Content'], '.js')
+
+				# If PMD finished with an error code
+				if block_violations == -1:
 					print('Error in generated-code quality analysis')
 					return -1
+
+				# Extract the violations by category found and save it to dictionary
+				total_violations, violations_by_cat, violation_records = count_violations(block_violations)
+
+				# Formulate the final dictionary containing the information to be stored to the db
+				code['Violations'] = {'Total': total_violations}
+				code['Violations'].update({'ViolationsByCat': violations_by_cat})
+				code['Violations'].update({'Details': violation_records})
+				conversation['ListOfCode'][j] = code
+				conv_changed = True
 		
 		if conv_changed:
 			sharing['Conversations'][i] = conversation
@@ -1,20 +1,361 @@
+import json
+import time
+import hashlib
 import pymongo
+from pymongo import InsertOne, UpdateOne, monitoring
+from libs.metrics import metrics
+
+def get_source_hash(source):
+    """
+    Computes a hash of a source's content, in order to detect whether it changed between two snapshots.
+    The NumericID attribute is not part of the hash, as it depends on the position of the source in the snapshot.
+    """
+    content = {key: value for key, value in source.items() if key not in ('_id', 'NumericID', 'SourceHash')}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+# Attributes that are added to the sources after ingest (download, annotation and analysis), and are not part of their snapshot content
+derived_fields = ('CommitContent', 'Annotation', 'Language', 'AnalysisFeatures')
+
+def get_stored_source_hash(document):
+    """
+    Computes the hash of a stored source that has no SourceHash (e.g. stored by an older version), from its snapshot content:
+    the attributes added after ingest, and the quality violations added to its generated code blocks, are not part of the hash.
+    """
+    source = {key: value for key, value in document.items() if key not in derived_fields}
+    if 'ChatgptSharing' in source:
+        source['ChatgptSharing'] = [
+            {**sharing, 'Conversations': [
+                {**conversation, 'ListOfCode': [{key: value for key, value in code.items() if key != 'Violations'} for code in conversation['ListOfCode']]}
+                if 'ListOfCode' in conversation else conversation
+                for conversation in sharing['Conversations']
+            ]} if 'Conversations' in sharing else sharing
+            for sharing in source['ChatgptSharing']
+        ]
+    return get_source_hash(source)
+
+class BulkWriter:
+    """
+    Class for buffering the write operations on a collection and executing them as unordered bulk writes,
+    when the buffer is full or some time has passed since the last write. 
+    Multiple `$set` updates on the same document (filtered by `_id`) are merged into one operation.
+    """
+
+    def __init__(self, collection, batch_size=1000, flush_interval=5):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.operations = []
+        self.updates = {} # _id -> merged `$set` fields
+        self.last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def insert(self, document):
+        self.operations.append(InsertOne(document))
+        self._flush_if_needed()
+
+    def update(self, filter, update):
+        if list(filter) == ['_id'] and list(update) == ['$set']:
+            fields = self.updates.get(filter['_id'], {})
+            # A field cannot be set together with one of its subfields, so write the pending fields first
+            if any(self._overlap(field, new_field) and field != new_field for field in fields for new_field in update['$set']):
+                self.flush()
+                fields = {}
+            fields.update(update['$set'])
+            self.updates[filter['_id']] = fields
+        else:
+            self.operations.append(UpdateOne(filter, update))
+        self._flush_if_needed()
+
+    def pending(self):
+        return len(self.operations) + len(self.updates)
+
+    def flush(self):
+        operations = self.operations + [UpdateOne({'_id': _id}, {'$set': fields}) for _id, fields in self.updates.items()]
+        if operations:
+            with metrics.time('db_write'):
+                self.collection.bulk_write(operations, ordered=False)
+        self.operations = []
+        self.updates = {}
+        self.last_flush = time.monotonic()
+
+    def _flush_if_needed(self):
+        if self.pending() >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    @staticmethod
+    def _overlap(field1, field2):
+        return field1 == field2 or field1.startswith(field2 + '.') or field2.startswith(field1 + '.')
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Listener of the commands sent to MongoDB, that counts them by name (`db_operations`) and adds their round-trip time to the 'database' stage.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.count('db_operations', event.command_name)
+        metrics.add_time('database', event.duration_micros / 1e6)
+
+    def failed(self, event):
+        metrics.count('db_operations', event.command_name)
+        metrics.count('db_errors', event.command_name)
+        metrics.add_time('database', event.duration_micros / 1e6)
+
+class ResultCache:
+    """
+    Class for caching the results of an analysis step in a capped collection, keyed by a hash of the step's inputs.
+    The capped collection keeps the most recently stored results, so the size of the cache is bounded.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(*inputs):
+        """
+        Returns the key of a result, a hash of the inputs (and the version of the analysis) that determine it.
+        """
+        return hashlib.sha256(json.dumps(inputs, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached result of a key, or None if it is not cached.
+        """
+        document = self.collection.find_one({'Key': key}, {'Result': True})
+        if document is None:
+            self.misses += 1
+            metrics.count('cache_misses', self.collection.name)
+            return None
+        self.hits += 1
+        metrics.count('cache_hits', self.collection.name)
+        return document['Result']
+
+    def get_many(self, keys):
+        """
+        Returns the cached results of a list of keys with a single query, as a dictionary mapping each cached key to its result.
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        results = {
+            document['Key']: document['Result']
+            for document in self.collection.find({'Key': {'$in': keys}}, {'_id': False, 'Key': True, 'Result': True})
+        }
+        hits, misses = len(results), len(keys) - len(results)
+        self.hits += hits
+        self.misses += misses
+        if hits:
+            metrics.count('cache_hits', self.collection.name, hits)
+        if misses:
+            metrics.count('cache_misses', self.collection.name, misses)
+        return results
+
+    def put(self, key, result):
+        self.collection.insert_one({'Key': key, 'Result': result})
 
 class DBManager:
     """
     Class for maintaining a MongoDB database.
     """
 
+    # Indexes of the database (collection name -> list of index keys)
+    indexes = {
+        'commits': [
+            [('URL', pymongo.ASCENDING)],
+            [('Sha', pymongo.ASCENDING)],
+            [('ChatgptSharing.Conversations.ListOfCode.Type', pymongo.ASCENDING)],
+            [('Annotation', pymongo.ASCENDING)],
+        ],
+        'links': [[('MentionedSource', pymongo.ASCENDING), ('MentionedURL', pymongo.ASCENDING)]],
+        'discussions': [[('URL', pymongo.ASCENDING)]],
+        'pull_requests': [[('URL', pymongo.ASCENDING)]],
+        'issues': [[('URL', pymongo.ASCENDING)]],
+        'files': [[('URL', pymongo.ASCENDING)]],
+        'hacker-news': [[('URL', pymongo.ASCENDING)]],
+    }
+
+    # Main queries of the analysis, whose plans should use the indexes (name -> (collection name, filter))
+    queries = {
+        'Links of commits': ('links', {'MentionedSource': 'commit'}),
+        'Commit by URL': ('commits', {'URL': ''}),
+        'Commits by URLs': ('commits', {'URL': {'$in': ['']}}),
+        'Commit by Sha': ('commits', {'Sha': ''}),
+        'Commits with JavaScript code': ('commits', {'ChatgptSharing.Conversations.ListOfCode.Type': 'javascript'}),
+        'Commits by annotation': ('commits', {'Annotation': ''}),
+    }
+
     def __init__(self, dbpath):
-        self.client = pymongo.MongoClient(dbpath)
+        self.client = pymongo.MongoClient(dbpath, event_listeners=[CommandMetrics()])
         self.db = self.client["devgpt"] # database
 
     def drop_db(self):
         self.client.drop_database("devgpt")
 
-    def add_data(self, collection_name, data):
+    def add_data(self, collection_name, data, source_hash=False):
+        """
+        Inserts the data to a collection. If `source_hash` is True, the content hash of each source is stored (see `get_source_hash`),
+        so that a later incremental ingest finds the unchanged sources.
+        """
+        collection = self.db[collection_name]
+        if source_hash:
+            for source in data:
+                source['SourceHash'] = get_source_hash(source)
+        with metrics.time('db_write'):
+            collection.insert_many(data)
+
+    def upsert_data(self, collection_name, data, key, reset_fields=()):
+        """
+        Inserts the new sources and updates the changed ones, identifying each source by a stable key attribute.
+        The sources whose content is unchanged (see `get_source_hash`) keep their attributes computed after ingest,
+        and only their NumericID (their position in the current snapshot) is updated, so that it does not collide with the new sources.
+        A stored source without SourceHash is compared by its content (see `get_stored_source_hash`), and its hash is stored.
+
+        :param collection_name: The name of the collection.
+        :param data: A list of dictionaries, each representing one source.
+        :param key: The attribute that identifies a source across snapshots, e.g. 'URL' or 'Sha'.
+        :param reset_fields: The attributes (computed after ingest) to remove from the changed sources.
+        :returns: A dictionary with the number of 'Inserted', 'Updated' and 'Unchanged' sources.
+        """
         collection = self.db[collection_name]
-        collection.insert_many(data)
+        counts = {'Inserted': 0, 'Updated': 0, 'Unchanged': 0}
+        if not data:
+            return counts
+
+        # Get the content hash and the NumericID of the sources that already exist
+        existing = {
+            document[key]: (document.get('SourceHash'), document.get('NumericID'))
+            for document in collection.find({key: {'$in': [source[key] for source in data]}}, {key: True, 'SourceHash': True, 'NumericID': True})
+        }
+
+        # Compute the hash of the stored sources without SourceHash from their content
+        missing = [source_key for source_key, (stored_hash, _) in existing.items() if stored_hash is None]
+        stored_hashes = {}
+        if missing:
+            stored_hashes = {document[key]: get_stored_source_hash(document) for document in collection.find({key: {'$in': missing}})}
+
+        operations = []
+        for source in data:
+            source_hash = get_source_hash(source)
+            if source[key] not in existing:
+                operations.append(InsertOne({**source, 'SourceHash': source_hash}))
+                counts['Inserted'] += 1
+                continue
+
+            stored_hash, numericid = existing[source[key]]
+            if stored_hash is None and stored_hashes.get(source[key]) == source_hash:
+                operations.append(UpdateOne({key: source[key]}, {'$set': {'SourceHash': source_hash, 'NumericID': source.get('NumericID')}}))
+                counts['Unchanged'] += 1
+            elif stored_hash == source_hash:
+                if numericid != source.get('NumericID'):
+                    operations.append(UpdateOne({key: source[key]}, {'$set': {'NumericID': source.get('NumericID')}}))
+                counts['Unchanged'] += 1
+            else:
+                update = {'$set': {**source, 'SourceHash': source_hash}}
+                if reset_fields:
+                    update['$unset'] = {field: "" for field in reset_fields}
+                operations.append(UpdateOne({key: source[key]}, update))
+                counts['Updated'] += 1
+
+        if operations:
+            with metrics.time('db_write'):
+                collection.bulk_write(operations, ordered=False)
+        return counts
+
+    def remove_missing(self, collection_name, key, keys_to_keep):
+        """
+        Removes the sources whose key attribute is not contained in the given keys (sources missing from the current snapshot).
+
+        :returns: The number of removed sources.
+        """
+        collection = self.db[collection_name]
+        ids = [document['_id'] for document in collection.find({}, {key: True}) if document.get(key) not in keys_to_keep]
+        if ids:
+            collection.delete_many({'_id': {'$in': ids}})
+        return len(ids)
+
+    def create_indexes(self):
+        """
+        Creates the declared indexes of the database (creating an existing index has no effect).
+        """
+        for collection_name, index_list in self.indexes.items():
+            for keys in index_list:
+                self.db[collection_name].create_index(keys)
+
+    def explain_queries(self):
+        """
+        Explains the plan of the main queries of the analysis.
+
+        :returns: A dictionary mapping the name of each query to the list of stages of its winning plan.
+        """
+        plans = {}
+        for name, (collection_name, filter) in self.queries.items():
+            explanation = self.db[collection_name].find(filter).explain()
+            plans[name] = self._get_plan_stages(explanation['queryPlanner']['winningPlan'])
+        return plans
+
+    def check_query_plans(self):
+        """
+        Checks that none of the main queries of the analysis is executed with a collection scan, and prints a warning for each one that is.
+
+        :returns: A list with the names of the queries executed with a collection scan.
+        """
+        collection_scans = [name for name, stages in self.explain_queries().items() if 'COLLSCAN' in stages]
+        for name in collection_scans:
+            print(f"Warning: query '{name}' is executed with a collection scan (COLLSCAN)")
+        return collection_scans
+
+    @staticmethod
+    def _get_plan_stages(plan):
+        stages = []
+        if isinstance(plan, dict):
+            if 'stage' in plan:
+                stages.append(plan['stage'])
+            for value in plan.values():
+                stages.extend(DBManager._get_plan_stages(value))
+        elif isinstance(plan, list):
+            for value in plan:
+                stages.extend(DBManager._get_plan_stages(value))
+        return stages
+
+    def add_annotations(self, annotations):
+        """
+        Stores the annotation category of each annotated commit to its document (`Annotation` attribute).
+
+        :param annotations: A dictionary mapping the URL of each annotated commit to its annotation category.
+        :returns: The number of annotated commits found in the database.
+        """
+        operations = [UpdateOne({'URL': url}, {'$set': {'Annotation': annotation}}) for url, annotation in annotations.items()]
+        if not operations:
+            return 0
+        return self.db['commits'].bulk_write(operations, ordered=False).matched_count
+
+    def get_checkpoint(self, name):
+        """
+        Returns the value of a progress checkpoint, or None if it was never set.
+        """
+        checkpoint = self.db['checkpoints'].find_one({'_id': name})
+        return checkpoint['Value'] if checkpoint else None
+
+    def set_checkpoint(self, name, value):
+        """
+        Records the progress of a (resumable) step in the database.
+        """
+        self.db['checkpoints'].update_one({'_id': name}, {'$set': {'Value': value}}, upsert=True)
+
+    def clear_checkpoint(self, name):
+        """
+        Removes a progress checkpoint, once its step is complete.
+        """
+        self.db['checkpoints'].delete_one({'_id': name})
 
     def get_all_documents(self, collection_name):
         return self.db[collection_name].find()
@@ -23,5 +364,28 @@ class DBManager:
         collection = self.db[collection_name]
         collection.update_one(filter, update)
 
+    def bulk_writer(self, collection_name, batch_size=1000, flush_interval=5):
+        """
+        Returns a `BulkWriter` for the collection. Its pending operations are written when it is flushed,
+        when `batch_size` operations are pending, or when `flush_interval` seconds passed since the last write.
+        """
+        return BulkWriter(self.db[collection_name], batch_size, flush_interval)
+
+    def get_cache(self, name, max_size):
+        """
+        Returns a `ResultCache` stored in the 'devgptcache' database, which is not dropped when the database is recreated.
+        The cache is a capped collection of at most `max_size` bytes, that is created if it does not exist.
+        """
+        cachedb = self.client["devgptcache"]
+        if name not in cachedb.list_collection_names():
+            try:
+                cachedb.create_collection(name, capped=True, size=max_size)
+            except (pymongo.errors.CollectionInvalid, pymongo.errors.OperationFailure) as error:
+                # Another process created the cache concurrently (NamespaceExists)
+                if isinstance(error, pymongo.errors.OperationFailure) and error.code != 48:
+                    raise
+            cachedb[name].create_index([('Key', pymongo.ASCENDING)])
+        return ResultCache(cachedb[name])
+
     def close(self):
         self.client.close()
\ No newline at end of file
@@ -1,53 +1,252 @@
-import requests
+import os
+import gzip
+import time
 import json
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from properties import githubapikey
+from libs.metrics import metrics
 
-def download_commits_content(commits):
+class RateLimiter:
 	"""
-	This function takes a list of commits and downloads the content of each, using the GitHub API.
-	
-	:param commits: A list of dictionaries, where each dictionary represents a commit.
-	:returns: A list of dictionaries containing the updates to be made to the 'commits' collection. 
-	Each dictionary contains the commit's ID and content attribute. If API call was not successful 
-	or GitHub's API remaining request number is low, return (-1)
+	Class for sharing the state of GitHub's API rate limit between the download threads.
+	When the remaining requests are low, or a secondary rate limit is hit, all threads pause until the limit resets.
 	"""
-	
-	# Define a list to store dictionaries with the commit's ID and content attribute
-	update_list = []
 
-	for commit in commits:
-	
-		update_dict = {}
+	def __init__(self, min_remaining=10):
+		self.lock = threading.Lock()
+		self.min_remaining = min_remaining
+		self.resume_time = 0
+
+	def wait(self):
+		"""
+		Blocks until requests are allowed again.
+		"""
+		while True:
+			with self.lock:
+				delay = self.resume_time - time.time()
+			if delay <= 0:
+				return
+			time.sleep(delay)
+
+	def pause(self, seconds):
+		"""
+		Pauses all requests for the given number of seconds.
+		"""
+		with self.lock:
+			resume_time = time.time() + seconds
+			if resume_time > self.resume_time:
+				self.resume_time = resume_time
+				print(f"GitHub: Rate limit reached, waiting {int(seconds)} seconds.")
+
+	def update(self, headers):
+		"""
+		Checks GitHub's API rate limit headers of a response, and pauses the requests until the limit resets if the remaining requests are low.
+		"""
+		if 'X-RateLimit-Remaining' in headers and int(headers['X-RateLimit-Remaining']) <= self.min_remaining:
+			reset_time = int(headers.get('X-RateLimit-Reset', time.time() + 60))
+			self.pause(max(reset_time - time.time(), 0) + 1)
+
+
+class ResponseCache:
+	"""
+	Class for storing GitHub's API responses on disk, compressed. Each response is stored in a file named
+	after the hash of its API URL (for commits, the URL is determined by the repository and the sha).
+	"""
+
+	def __init__(self, cachedir):
+		self.cachedir = cachedir
+		os.makedirs(cachedir, exist_ok=True)
+
+	def get_path(self, apiurl):
+		key = hashlib.sha256(apiurl.encode('utf-8')).hexdigest()
+		return os.path.join(self.cachedir, key[:2], key + '.json.gz')
+
+	def get(self, apiurl):
+		"""
+		Returns the cached entry of an API URL, a dictionary with the 'Content' of the response and its 'ETag', or None if it is not cached.
+		"""
+		path = self.get_path(apiurl)
+		if not os.path.exists(path):
+			return None
+		with gzip.open(path, 'rt', encoding='utf-8') as infile:
+			return json.load(infile)
 
-		# Get commit's ID and store it to dictionary
-		update_dict['_id'] = commit['_id']
+	def put(self, apiurl, content, etag=None):
+		"""
+		Stores the response of an API URL to the cache.
+		"""
+		path = self.get_path(apiurl)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		# Write to a temporary file first, so that interrupted writes never leave a corrupted entry
+		temp_path = f"{path}.{threading.get_ident()}.tmp"
+		with gzip.open(temp_path, 'wt', encoding='utf-8') as outfile:
+			json.dump({'ETag': etag, 'Content': content}, outfile)
+		os.replace(temp_path, path)
 
-		# Get commit's reponame and sha 
-		reponame = commit['RepoName']
-		sha = commit['Sha']
-		apiurl = "https://api.github.com/repos/" + reponame + "/commits/" + sha
 
-		# Use GitHub token to achieve better maximum API call rate
-		headers = {}
-		headers['Authorization'] = 'token ' + githubapikey
+def create_session(workers):
+	"""
+	Creates an HTTP session for GitHub's API, that reuses up to `workers` connections.
+
+	:param workers: An integer specifying the number of concurrent requests.
+	:returns: The requests session.
+	"""
+
+	session = requests.Session()
+	session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+
+	# Use GitHub token to achieve better maximum API call rate
+	session.headers['Authorization'] = 'token ' + githubapikey
+
+	return session
+
+
+def download_commit_content(session, ratelimiter, reponame, sha, retries=5, cache=None, revalidate=False):
+	"""
+	This function downloads the content of a commit, using the GitHub API. Requests that hit a secondary
+	rate limit, fail with a server error (5xx), or fail to connect are retried with exponential backoff.
+
+	:param session: The HTTP session used for the request.
+	:param ratelimiter: The `RateLimiter` shared between the download threads.
+	:param reponame: The name of the commit's repository.
+	:param sha: The sha of the commit.
+	:param retries: The maximum number of retries of the request.
+	:param cache: A `ResponseCache` that is checked before making the request, and stores the successful responses.
+	:param revalidate: Boolean. If (True), cached responses are revalidated with a conditional request (If-None-Match),
+	instead of being used directly. Should only be needed for endpoints that are not immutable.
+	:returns: The API response (JSON) of the commit. If all retries failed, an exception is raised. If the request failed
+	with an error that is not retried (e.g. 404), a `requests.HTTPError` is raised.
+	"""
+
+	apiurl = "https://api.github.com/repos/" + reponame + "/commits/" + sha
+
+	# Commits are immutable, so a cached response can be used without any request
+	cached = cache.get(apiurl) if cache else None
+	if cache:
+		metrics.count('cache_hits' if cached else 'cache_misses', 'commits')
+	headers = {}
+	if cached:
+		if not revalidate:
+			return cached['Content']
+		if cached['ETag']:
+			headers['If-None-Match'] = cached['ETag']
+
+	for attempt in range(retries + 1):
+		backoff = 2 ** attempt
+		ratelimiter.wait()
 
 		try:
 			# API call to get GitHub's commit information
-			response = requests.get(apiurl, headers = headers)
-
-			# Store API response to update's dictionary
-			update_dict['CommitContent'] = json.loads(response.text)
-
-			# Add update dictionary to update list
-			update_list.append(update_dict)
-
-			# Check GitHub's API call rate limit
-			if 'X-RateLimit-Remaining' in response.headers:
-				if int(response.headers['X-RateLimit-Remaining']) <= 10:
-					print("GitHub: X-RateLimit-Remaining is low, please try again later.")
-					return -1
-		except:
-			print("Bad request response on commit:", commit['NumericID'])
-			return -1
-		
-	return update_list
+			with metrics.time('http_request'):
+				response = session.get(apiurl, headers=headers, timeout=60)
+		except requests.RequestException:
+			metrics.count('http_requests', 'error')
+			if attempt == retries:
+				raise
+			time.sleep(backoff)
+			continue
+
+		metrics.count('http_requests', str(response.status_code))
+
+		# Check GitHub's API call rate limit
+		ratelimiter.update(response.headers)
+
+		# Secondary rate limit (or primary rate limit exhausted), wait and retry
+		if response.status_code in (403, 429) and ('Retry-After' in response.headers or 'rate limit' in response.text.lower()):
+			if 'Retry-After' in response.headers:
+				ratelimiter.pause(int(response.headers['Retry-After']))
+			elif response.headers.get('X-RateLimit-Remaining') != '0':
+				ratelimiter.pause(60 * backoff)
+			continue
+
+		# Server error, wait and retry
+		if response.status_code >= 500:
+			time.sleep(backoff)
+			continue
+
+		# Cached response is still valid
+		if response.status_code == 304 and cached:
+			return cached['Content']
+
+		# Other errors (e.g. not found) are not retried, and their response is not returned as the commit's content
+		if response.status_code != 200:
+			raise requests.HTTPError(f"Request failed with status code {response.status_code}: {apiurl}", response=response)
+
+		content = json.loads(response.text)
+		if cache:
+			cache.put(apiurl, content, response.headers.get('ETag'))
+		return content
+
+	raise Exception(f"Request failed after {retries} retries: {apiurl}")
+
+
+def download_commits_content(commits, writer, workers=8, cache=None, revalidate=False):
+	"""
+	This function takes a list of commits, downloads the content of each, using the GitHub API, and writes
+	it to the 'commits' collection as soon as it arrives. Up to `workers` requests are made concurrently, 
+	and when GitHub's API remaining request number is low, the download waits until the rate limit resets.
+	If a request fails, the contents downloaded so far are still written, so that a later run only needs 
+	to download the commits that still lack their content. A commit whose request fails with an error that is not
+	retried (e.g. 404) is left without content, and the download continues with the other commits.
+
+	:param commits: A list of dictionaries, where each dictionary represents a commit.
+	:param writer: A `BulkWriter` of the 'commits' collection, used to write the contents in batches.
+	:param workers: An integer specifying the maximum number of concurrent requests.
+	:param cache: A `ResponseCache` to use, so that commits that were already downloaded are not requested again.
+	:param revalidate: Boolean. If (True), cached responses are revalidated with conditional requests.
+	:returns: The number of commits whose content was downloaded. If an API call was not successful, return (-1)
+	"""
+
+	downloaded = 0
+
+	session = create_session(workers)
+	# Keep enough remaining requests for the requests that are already in flight
+	ratelimiter = RateLimiter(max(10, workers))
+
+	def download(commit):
+		return download_commit_content(session, ratelimiter, commit['RepoName'], commit['Sha'], cache=cache, revalidate=revalidate)
+
+	try:
+		with ThreadPoolExecutor(max_workers=workers) as executor:
+			# Keep a bounded number of requests in flight
+			in_flight = {}
+			commits = iter(commits)
+			failed = False
+			incomplete = False
+
+			while True:
+				while not failed and len(in_flight) < workers:
+					commit = next(commits, None)
+					if commit is None:
+						break
+					in_flight[executor.submit(download, commit)] = commit
+
+				if not in_flight:
+					break
+
+				done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+				for future in done:
+					commit = in_flight.pop(future)
+					try:
+						content = future.result()
+					except requests.HTTPError:
+						print("Bad request response on commit:", commit['NumericID'])
+						incomplete = True
+						continue
+					except Exception:
+						print("Bad request response on commit:", commit['NumericID'])
+						failed = True
+						continue
+					# Write the commit's content
+					writer.update({'_id': commit['_id']}, {'$set': {'CommitContent': content}})
+					downloaded += 1
+	finally:
+		# Write the buffered contents even if the download was interrupted
+		writer.flush()
+		session.close()
+
+	return -1 if failed or incomplete else downloaded
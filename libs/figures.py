@@ -0,0 +1,203 @@
+import os
+import re
+import numpy as np
+import matplotlib.pyplot as plt
+
+def get_rq1_data(tables):
+	"""
+	This function computes the data of RQ-1 from the results tables (see `libs.resultstables`): for each commit of class 
+	`write me this code` (1) with copied code, the max number of prompts before the copied code blocks.
+
+	:param tables: A dictionary mapping the name of each results table to its columns.
+	:returns: A list with the number of prompts of each commit.
+	"""
+
+	commits, files = tables['commits'], tables['files']
+
+	# Keep only the files with copied code, of the commits of class `write me this code` (1)
+	selected = (files['LinesCopied'] > 0) & (commits['Category'][files['CommitIdx']] == "1")
+
+	# For each commit, get the max number of prompts before the copied code blocks
+	commit_idxs, file_commits = np.unique(files['CommitIdx'][selected], return_inverse=True)
+	prompts = np.full(len(commit_idxs), np.iinfo(np.int64).min)
+	np.maximum.at(prompts, file_commits, files['PromptsBeforeClone'][selected])
+	return prompts.tolist()
+
+
+def get_rq2_data(tables):
+	"""
+	This function computes the data of RQ-2 from the results tables (see `libs.resultstables`): the violations of the 
+	JS code blocks of the commits of class `write me this code` (1).
+
+	:param tables: A dictionary mapping the name of each results table to its columns.
+	:returns: A tuple containing the list of total violations of each JS code block, and a dictionary with the 
+	total number of violations by category.
+	"""
+
+	commits, blocks = tables['commits'], tables['blocks']
+
+	# Keep only the JS code blocks with violations, of the commits of class `write me this code` (1)
+	selected = (blocks['Type'] == 'javascript') & blocks['HasViolations'] & (commits['Category'][blocks['CommitIdx']] == "1")
+
+	violations = blocks['TotalViolations'][selected].tolist()
+	violations_categories = {category: int(blocks[category][selected].sum()) for category in ('BestPractices', 'CodeStyle', 'ErrorProne')}
+	return violations, violations_categories
+
+
+def get_rq3_data(tables):
+	"""
+	This function computes the data of RQ-3 from the results tables (see `libs.resultstables`): the difference of violations 
+	between the two versions of the committed files, of the commits of class `improve this code` (2).
+
+	:param tables: A dictionary mapping the name of each results table to its columns.
+	:returns: A list with the difference of violations (current - previous) of each file.
+	"""
+
+	commits, files = tables['commits'], tables['files']
+
+	# Keep only the entries of class `improve this code` (2), where quality analysis was done, and previous version exists
+	selected = files['QualityAnalyzed'] & files['HasPreviousContent'] & (commits['Category'][files['CommitIdx']] == "2")
+	return (files['CurrentViolations'] - files['PreviousViolations'])[selected].tolist()
+
+
+def plot_rq1(prompts_number_until_copy_paste, results_folder):
+	"""
+	This function generates the figure of RQ-1 (histogram of the number of prompts before copying code), in EPS and PDF format.
+	"""
+
+	# Define the max number of the x-axis
+	max_value = 20
+
+	# Create the histogram
+	fig = plt.figure(figsize=(4.85, 2.62))
+
+	bins = list(range(0, max_value+2))  # Including max number in the last bin
+	clipped_values = np.minimum(prompts_number_until_copy_paste, max_value)
+
+	# Create the histogram using the clipped values
+	hist_values, bin_edges, _ = plt.hist(clipped_values, bins=bins, edgecolor='black')
+
+	# Set x-axis ticks and labels
+	bin_labels = [str(int(bin_edge)) if bin_edge < max_value else '  '+str(max_value)+'+' for bin_edge in bin_edges[:-1]]
+	bin_ticks = np.arange(len(bin_labels)) + 0.5
+
+	plt.xticks(bin_ticks, [''] + bin_labels[1:])  # Set the first label to an empty string
+	plt.xlim(0.5, max(bin_ticks) + 1)
+
+	# Add labels
+	plt.xlabel('Number of Prompts', fontsize=13)
+	plt.ylabel('Frequency', fontsize=13)
+
+	# Save the plot to results
+	plt.tight_layout()
+	plt.subplots_adjust(bottom=0.2, top=1)
+	plt.savefig(os.path.join(results_folder, 'RQ1NumPromptsBeforeCopying.eps'), format='eps')
+	plt.savefig(os.path.join(results_folder, 'RQ1NumPromptsBeforeCopying.pdf'), format='pdf')
+	plt.close(fig)
+
+
+def plot_rq2(violations, violations_categories, results_folder):
+	"""
+	This function generates the figures of RQ-2 (histogram of total violations found in JS code blocks, and pie chart
+	of violation categories), in EPS and PDF format.
+	"""
+
+	# Figure 1: Histogram of total violations found in JS code blocks
+	# Create the histogram of violations found in all JS blocks
+	fig = plt.figure(1, figsize=(4.85, 2.62))
+
+	# Adjust the white space around the figure
+	plt.subplots_adjust(bottom=0.15)
+
+	bins = list(range(min(violations), max(violations) + 2))
+	plt.hist(violations, bins=bins, edgecolor='black')
+	plt.xticks(np.array(bins[:-1]) + 0.5, bins[:-1])
+	# Set the x-axis limits
+	plt.xlim(min(violations) - 0.5, max(violations) + 1.5)
+	# Add labels and title
+	plt.xlabel('Number of Violations', fontsize=13)
+	plt.ylabel('Frequency', fontsize=13)
+
+	# Save the plot to results
+	plt.tight_layout()
+	plt.subplots_adjust(bottom=0.2, top=1)
+	plt.savefig(os.path.join(results_folder, 'RQ2TotalViolations.eps'), format='eps')
+	plt.savefig(os.path.join(results_folder, 'RQ2TotalViolations.pdf'), format='pdf')
+	plt.close(fig)
+
+	# Figure 2: Pie chart of violation categories
+	# Create the pie chart
+	sorted_violations_categories = dict(sorted(violations_categories.items(), key=lambda item: item[1], reverse=True))
+	fig, ax = plt.subplots(figsize=(4.85, 2.42))
+
+	wedges, texts, autotexts = ax.pie(sorted_violations_categories.values(), labels=[''] * len(sorted_violations_categories),
+	                                   autopct='%1.1f%%', startangle=90)
+
+	plt.axis('equal')
+
+	# Create legend using proxy artists
+	legend_labels = [' '.join(re.sub('([A-Z]+)', r' \1', category).split()) for category in sorted_violations_categories.keys()]
+	prop_cycle = plt.rcParams['axes.prop_cycle']
+	colors = prop_cycle.by_key()['color']
+	legend_handles = [plt.Line2D([0], [0], marker='o', color='w', markerfacecolor=colors[i], markersize=10,
+	                            label=label) for i, label in enumerate(legend_labels)]
+
+	# Move the plot to the right to avoid overlap with the legend
+	plt.subplots_adjust(left=0)
+
+	# Display legend
+	ax.legend(handles=legend_handles, bbox_to_anchor=(1.35, 1), loc='upper right')
+
+	plt.tight_layout()
+	plt.subplots_adjust(bottom=0.2, top=1)
+	plt.savefig(os.path.join(results_folder, 'RQ2ViolationCategories.eps'), format='eps')
+	plt.savefig(os.path.join(results_folder, 'RQ2ViolationCategories.pdf'), format='pdf')
+	plt.close(fig)
+
+
+def plot_rq3(before_after_diff, results_folder):
+	"""
+	This function generates the figure of RQ-3 (change in violations between the two versions of the committed files), in EPS and PDF format.
+	"""
+
+	# Create a list of differences with zeros removed
+	before_after_diff_nz = [a for a in before_after_diff if a]
+
+	# Create the bar chart of differences
+	fig, ax = plt.subplots(figsize=(4.85, 3))
+
+	# Adjust the white space around the figure
+	plt.subplots_adjust(bottom=0.15)
+
+	before_after_diff_nz = np.array(before_after_diff_nz)
+
+	# Plotting the data with two different colors
+	added_violations = np.where(before_after_diff_nz > 0, before_after_diff_nz, 0)
+	removed_violations = np.where(before_after_diff_nz < 0, before_after_diff_nz, 0)
+
+	bars_added = ax.barh(range(len(before_after_diff_nz)), added_violations, color='green', label='Violations\nIncreased')
+	bars_removed = ax.barh(range(len(before_after_diff_nz)), removed_violations, color='red', label='Violations\nDecreased')
+
+	# Set labels
+	ax.set_xlabel('Change in Violations', fontsize=13)
+	ax.set_ylabel('Case Index', fontsize=13)
+
+	# Calculate new x-axis limits based on the data
+	data_max = np.max(np.abs(before_after_diff_nz))
+	rounded_max = 5 * round((data_max + 5) / 5)
+
+	# Set ticks and labels based on the rounded values
+	ticks = np.arange(-rounded_max, rounded_max + 1, 5)
+	ax.set_xticks(ticks)
+	ax.set_xticklabels([str(t) for t in ticks])
+
+	# Extend the x-axis range a little bit from the right
+	current_xlim = ax.get_xlim()
+	new_xlim = (current_xlim[0] - 2, current_xlim[1] + 2)
+	ax.set_xlim(new_xlim)
+
+	plt.legend()
+	plt.tight_layout()
+	plt.savefig(os.path.join(results_folder, 'RQ3ViolationDifference.eps'), format='eps')
+	plt.savefig(os.path.join(results_folder, 'RQ3ViolationDifference.pdf'), format='pdf')
+	plt.close(fig)
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from properties import metricspercommit
+
+class Metrics:
+	"""
+	Class for instrumenting the pipeline: the time spent in each stage (e.g. clone detection) and its number of calls,
+	and counters of events (e.g. subprocesses, database operations, cache hits), each with a label (e.g. the tool).
+	Optionally, the time spent in each stage is also recorded per item (e.g. per commit), to find the outliers.
+	It is thread-safe, and the metrics of other processes are added with `merge`.
+	"""
+
+	def __init__(self, peritem=False):
+		self.peritem = peritem
+		self.lock = threading.Lock()
+		self.started = time.time()
+		self.stages = {} # stage -> [seconds, calls]
+		self.counters = {} # counter -> {label: count}
+		self.items = [] # per-item timings
+		self.local = threading.local()
+
+	@contextmanager
+	def time(self, stage):
+		"""
+		Times the code of a stage (used in a `with` statement).
+		"""
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.add_time(stage, time.perf_counter() - start)
+
+	def add_time(self, stage, seconds):
+		"""
+		Adds one call of a stage, that took `seconds` (for stages that are not timed with `time`).
+		"""
+		with self.lock:
+			stage_metrics = self.stages.setdefault(stage, [0, 0])
+			stage_metrics[0] += seconds
+			stage_metrics[1] += 1
+		item_stages = getattr(self.local, 'item_stages', None)
+		if item_stages is not None:
+			item_stages[stage] = item_stages.get(stage, 0) + seconds
+
+	def count(self, counter, label, n=1):
+		with self.lock:
+			labels = self.counters.setdefault(counter, {})
+			labels[label] = labels.get(label, 0) + n
+
+	@contextmanager
+	def item(self, name):
+		"""
+		Records the time spent in each stage for an item (used in a `with` statement), if per-item timing is enabled.
+		"""
+		if not self.peritem:
+			yield
+			return
+
+		self.local.item_stages = {}
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			record = {'Item': name, 'Seconds': time.perf_counter() - start, 'Stages': self.local.item_stages}
+			self.local.item_stages = None
+			with self.lock:
+				self.items.append(record)
+
+	def snapshot(self):
+		"""
+		Returns the metrics recorded so far (to be added to the metrics of another process with `merge`), and resets them.
+		"""
+		with self.lock:
+			snapshot = {'Stages': self.stages, 'Counters': self.counters, 'Items': self.items}
+			self.stages, self.counters, self.items = {}, {}, []
+		return snapshot
+
+	def merge(self, snapshot):
+		with self.lock:
+			for stage, (seconds, calls) in snapshot['Stages'].items():
+				stage_metrics = self.stages.setdefault(stage, [0, 0])
+				stage_metrics[0] += seconds
+				stage_metrics[1] += calls
+			for counter, labels in snapshot['Counters'].items():
+				for label, n in labels.items():
+					self.counters.setdefault(counter, {})
+					self.counters[counter][label] = self.counters[counter].get(label, 0) + n
+			self.items.extend(snapshot['Items'])
+
+	def get_summary(self, script):
+		"""
+		Returns a summary of the metrics of a run. The items are sorted by their time, the slowest first.
+		"""
+		with self.lock:
+			return {
+				'Script': script,
+				'Started': self.started,
+				'Seconds': time.time() - self.started,
+				'Stages': {stage: {'Seconds': seconds, 'Calls': calls} for stage, (seconds, calls) in sorted(self.stages.items())},
+				'Counters': {counter: dict(sorted(labels.items())) for counter, labels in sorted(self.counters.items())},
+				'Items': sorted(self.items, key=lambda record: record['Seconds'], reverse=True),
+			}
+
+	def export(self, metricspath, script):
+		"""
+		Writes the summary of the metrics of a run to a JSON file, and to a text file in Prometheus' exposition format
+		(e.g. for the textfile collector of the node exporter). The per-item timings are only written to the JSON file.
+
+		:param metricspath: A string that specifies the folder of the files.
+		:param script: The name of the script (e.g. 'analyzedata'), used as the name of the files and as a label of the metrics.
+		:returns: A tuple containing the paths of the JSON and the Prometheus files.
+		"""
+
+		os.makedirs(metricspath, exist_ok=True)
+		summary = self.get_summary(script)
+
+		jsonpath = os.path.join(metricspath, f"{script}.json")
+		with open(jsonpath, 'w') as outfile:
+			json.dump(summary, outfile, indent=2)
+
+		lines = [
+			"# HELP devgpt_run_seconds Duration of the run.",
+			"# TYPE devgpt_run_seconds gauge",
+			f'devgpt_run_seconds{{script="{script}"}} {summary["Seconds"]}',
+			"# HELP devgpt_stage_seconds_total Time spent in each stage.",
+			"# TYPE devgpt_stage_seconds_total counter",
+		]
+		lines.extend(f'devgpt_stage_seconds_total{{script="{script}",stage="{stage}"}} {stage_metrics["Seconds"]}' for stage, stage_metrics in summary['Stages'].items())
+		lines.extend(["# HELP devgpt_stage_calls_total Number of calls of each stage.", "# TYPE devgpt_stage_calls_total counter"])
+		lines.extend(f'devgpt_stage_calls_total{{script="{script}",stage="{stage}"}} {stage_metrics["Calls"]}' for stage, stage_metrics in summary['Stages'].items())
+		for counter, labels in summary['Counters'].items():
+			lines.extend([f"# HELP devgpt_{counter}_total Number of {counter.replace('_', ' ')}.", f"# TYPE devgpt_{counter}_total counter"])
+			lines.extend(f'devgpt_{counter}_total{{script="{script}",name="{label}"}} {n}' for label, n in labels.items())
+
+		prompath = os.path.join(metricspath, f"{script}.prom")
+		# Write to a temporary file first, so that the collector never reads a partial file
+		with open(prompath + '.tmp', 'w') as outfile:
+			outfile.write('\n'.join(lines) + '\n')
+		os.replace(prompath + '.tmp', prompath)
+
+		return jsonpath, prompath
+
+
+# The metrics of the current process
+metrics = Metrics(metricspercommit)
@@ -1,5 +1,9 @@
 import os
-import regex as re
+import json
+import bisect
+import re
+import regex
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 def get_subpath(snapshotpath, datatype):
 	"""
@@ -14,15 +18,14 @@ def get_subpath(snapshotpath, datatype):
 	return os.path.join(snapshotpath, datasubpath)
     
 
-def contains_invalid_chars(text):
+def _build_invalid_chars_pattern():
 	"""
-	Checks if a given text contains any invalid Unicode character.
+	Builds, once at import time, a single character class regex that matches every invalid Unicode character.
+	Checked characters are those in the range \\u0080-\\uffef, and each of them is classified against the 
+	valid patterns below, so that matching the resulting class gives identical results to checking them one by one.
 	
-	:param text: The string to check for invalid characters.
-	:returns: Boolean. (True) if the input text contains any invalid characters, and (False) otherwise.
+	:returns: The compiled regex of the invalid characters.
 	"""
-	
-	all_unicode_patterns = re.compile(r'[\u0080-\uffef]', re.UNICODE)  # @UndefinedVariable
 
 	valid_patterns = [
 		r'[\u0080-\u00FF]', # "Latin-1 Supplement" category
@@ -36,115 +39,197 @@ def contains_invalid_chars(text):
 		r'[\p{Block=Emoticons}]', # Emoticons Block characters
 	]
 
-	valid_patterns = '|'.join(valid_patterns)
-	valid_patterns = re.compile(valid_patterns)
+	valid_patterns = regex.compile('|'.join(valid_patterns))
+
+	# Find the ranges of consecutive invalid code points
+	ranges = []
+	for codepoint in range(0x0080, 0xfff0):
+		if not valid_patterns.match(chr(codepoint)):
+			if ranges and ranges[-1][1] == codepoint - 1:
+				ranges[-1][1] = codepoint
+			else:
+				ranges.append([codepoint, codepoint])
 
-	all_unicode_characters = all_unicode_patterns.findall(text)
+	invalid_class = ''.join(f'\\u{first:04x}-\\u{last:04x}' if first != last else f'\\u{first:04x}' for first, last in ranges)
+	# (The standard `re` module is used, as it matches large character classes much faster than `regex`)
+	return re.compile(f'[{invalid_class}]')
 
-	for character in all_unicode_characters:
-		# If at least one non-valid unicode found, return True
-		if not valid_patterns.search(character):
-			return True
 
-	return False
+# Regex matching any invalid Unicode character
+invalid_chars_pattern = _build_invalid_chars_pattern()
 
 
-def collection_preprocessing(data, datatype, linkstodrop):
+def find_invalid_char(text):
+	"""
+	Finds the first invalid Unicode character of a given text.
+	
+	:param text: The string to check for invalid characters.
+	:returns: The first invalid character found in the text, or None if the text contains no invalid characters.
+	"""
+
+	match = invalid_chars_pattern.search(text)
+	return match.group() if match else None
+
+
+def find_invalid_chars(texts):
+	"""
+	Batch version of `find_invalid_char`, that validates a whole list of strings in one call.
+	
+	:param texts: A list of strings to check for invalid characters.
+	:returns: A list containing, for each of the given texts, its first invalid character, or None if it contains no invalid characters.
+	"""
+
+	results = [None] * len(texts)
+
+	# Join the texts with an (always valid) separator and keep the offset where each one starts
+	joined = '\n'.join(texts)
+	offsets = []
+	offset = 0
+	for text in texts:
+		offsets.append(offset)
+		offset += len(text) + 1
+
+	# Search the joined text once, skipping to the next text when an invalid character is found
+	match = invalid_chars_pattern.search(joined)
+	while match:
+		i = bisect.bisect_right(offsets, match.start()) - 1
+		results[i] = match.group()
+		if i + 1 == len(texts):
+			break
+		match = invalid_chars_pattern.search(joined, offsets[i + 1])
+
+	return results
+
+
+def contains_invalid_chars(text):
+	"""
+	Checks if a given text contains any invalid Unicode character.
+	
+	:param text: The string to check for invalid characters.
+	:returns: Boolean. (True) if the input text contains any invalid characters, and (False) otherwise.
 	"""
-	Checks whether the data contains invalid sources and removes them. Invalid sources are those that contain any of the following:
+
+	return invalid_chars_pattern.search(text) is not None
+
+
+def source_preprocessing(source, datatype, linkstodrop):
+	"""
+	Checks whether a single source is valid. Invalid sources are those that contain any of the following:
     - Specific non-UTF-8 characters
     - No valid response codes
     - Conversations that lack at least one code block.
 	
-	:param data: A dictionary containing the collection of sources.
+	:param source: A dictionary representing one source of the collection.
 	:param datatype: A string that specifies the type of data being processed. 
 	:param linkstodrop: A set that stores the URLs of the invalid links to be removed from the `links` collection.
+	:returns: Boolean. (True) if the source is valid, and (False) otherwise.
 	"""
-	
-	# Create set to store the indexes of invalid sources, in order to delete them
-	invalid_sources = set()
 
-	# Check if every source is valid or not
-	for i, source in enumerate(data['Sources']):
-
-		# For different data types (commits, discussion, etc), different text fields are checked
-		if datatype == "discussion" or datatype == "issue" or datatype == "pull-req":
-			# Check if entry's title or body contains contains non utf-8 characters
-			if contains_invalid_chars(source['Title']) or contains_invalid_chars(source['Body']):
-					invalid_sources.add(i) # Add source's index to invalid sources set
-					sharing_urls = [sharing['URL'] for sharing in source['ChatgptSharing']]
-					linkstodrop.update(sharing_urls) # Add its shared links to linkstodrop set
-					continue # check next source
-		
-		elif datatype == "commit":
-			# Check if entry's message contains non utf-8 characters
-			if contains_invalid_chars(source['Message']):
-					invalid_sources.add(i)
+	# For different data types (commits, discussion, etc), different text fields are checked
+	if datatype == "discussion" or datatype == "issue" or datatype == "pull-req":
+		# Check if entry's title or body contains contains non utf-8 characters
+		if contains_invalid_chars(source['Title']) or contains_invalid_chars(source['Body']):
+				sharing_urls = [sharing['URL'] for sharing in source['ChatgptSharing']]
+				linkstodrop.update(sharing_urls) # Add its shared links to linkstodrop set
+				return False
+	
+	elif datatype == "commit":
+		# Check if entry's message contains non utf-8 characters
+		if contains_invalid_chars(source['Message']):
+				sharing_urls = [sharing['URL'] for sharing in source['ChatgptSharing']]
+				linkstodrop.update(sharing_urls)
+				return False
+
+	elif datatype == "file":
+		# Check if entry's commit message contains non utf-8 characters
+		if contains_invalid_chars(source['CommitMessage']):
+				sharing_urls = [sharing['URL'] for sharing in source['ChatgptSharing']]
+				linkstodrop.update(sharing_urls)
+				return False
+
+	elif datatype == "hacker-news":
+		if source['Title']: # if Title attribute not null
+				# Check if entry's Title contains non utf-8 characters
+				if contains_invalid_chars(source['Title']):
 					sharing_urls = [sharing['URL'] for sharing in source['ChatgptSharing']]
 					linkstodrop.update(sharing_urls)
-					continue
+					return False
 
-		elif datatype == "file":
-			# Check if entry's commit message contains non utf-8 characters
-			if contains_invalid_chars(source['CommitMessage']):
-					invalid_sources.add(i)
-					sharing_urls = [sharing['URL'] for sharing in source['ChatgptSharing']]
-					linkstodrop.update(sharing_urls)
-					continue
-
-		elif datatype == "hacker-news":
-			if source['Title']: # if Title attribute not null
-					# Check if entry's Title contains non utf-8 characters
-					if contains_invalid_chars(source['Title']):
-						invalid_sources.add(i)
-						sharing_urls = [sharing['URL'] for sharing in source['ChatgptSharing']]
-						linkstodrop.update(sharing_urls)
-						continue
-
-		source_contains_code = False # Variable to check if source contains code blocks
-
-		contains_active_link = False # Variable to store whether reference contains at least one active link
-
-		# Ckeck each Chatgpt shared link
-		for sharing in source['ChatgptSharing']:
-			# Check status code of the Chatgpt shared link, and keep only success (200)
-			if sharing['Status'] != 200:
-					linkstodrop.add(sharing['URL'])
-					continue # continue to the next dialogue check
-			else:
-					contains_active_link = True
-
-			# For each conversation in the specific shared link, check if code block exists
-			link_contains_code = False
-			for conv in sharing['Conversations']:
-					if len(conv['ListOfCode']): # check if List of Code is not empty
-						link_contains_code = True # if code block found, no need to check the rest of the conversations, so exit loop
-						source_contains_code = True
-						break
-
-			# If no code blocks are detected in the link, add link to drop set
-			if not link_contains_code:
-				linkstodrop.add(sharing['URL'])
+	valid = True # Variable to store whether the source should be kept
 
-			# Check if conversation's prompt or answer contains non utf-8 characters
-			found = False # variable to exit nested loop
-			for conv in sharing['Conversations']:
-					if contains_invalid_chars(conv['Prompt']) or contains_invalid_chars(conv['Answer']):
-						invalid_sources.add(i)
-						sharing_urls = [sharing['URL'] for sharing in source['ChatgptSharing']]
-						linkstodrop.update(sharing_urls)
-						found = True
-						break # exit nested loop
-			if found: # if non utf-8 found, no need to check the rest of the dialogues, so exit loop
+	source_contains_code = False # Variable to check if source contains code blocks
+
+	contains_active_link = False # Variable to store whether reference contains at least one active link
+
+	# Ckeck each Chatgpt shared link
+	for sharing in source['ChatgptSharing']:
+		# Check status code of the Chatgpt shared link, and keep only success (200)
+		if sharing['Status'] != 200:
+				linkstodrop.add(sharing['URL'])
+				continue # continue to the next dialogue check
+		else:
+				contains_active_link = True
+
+		# For each conversation in the specific shared link, check if code block exists
+		link_contains_code = False
+		for conv in sharing['Conversations']:
+				if len(conv['ListOfCode']): # check if List of Code is not empty
+					link_contains_code = True # if code block found, no need to check the rest of the conversations, so exit loop
+					source_contains_code = True
 					break
 
-		# If there are no active links shared at the moment the snapshot was taken, remove source from data
-		if not contains_active_link:
-			invalid_sources.add(i)
+		# If no code blocks are detected in the link, add link to drop set
+		if not link_contains_code:
+			linkstodrop.add(sharing['URL'])
+
+		# Check if conversation's prompt or answer contains non utf-8 characters
+		texts = [text for conv in sharing['Conversations'] for text in (conv['Prompt'], conv['Answer'])]
+		if any(find_invalid_chars(texts)):
+				valid = False
+				sharing_urls = [sharing['URL'] for sharing in source['ChatgptSharing']]
+				linkstodrop.update(sharing_urls)
+				break # if non utf-8 found, no need to check the rest of the dialogues, so exit loop
+
+	# If there are no active links shared at the moment the snapshot was taken, remove source from data
+	if not contains_active_link:
+		valid = False
+
+	# If there are no code blocks in any of the shared links, remove source from data
+	if not source_contains_code:
+		valid = False
 
-		# If there are no code blocks in any of the shared links, remove source from data
-		if not source_contains_code:
-			invalid_sources.add(i)
+	return valid
+
+
+def validate_sources(sources, datatype, offset=0):
+	"""
+	Checks which of the given sources are invalid (see `source_preprocessing`). 
+	
+	:param sources: A list of dictionaries, each representing one source of the collection.
+	:param datatype: A string that specifies the type of data being processed. 
+	:param offset: An integer added to the indexes of the invalid sources (the position of the first of the
+	given sources in the whole collection).
+	:returns: Two values: `invalid_sources` and `linkstodrop`. `invalid_sources` is a set with the indexes of 
+	the invalid sources, while `linkstodrop` is a set with the URLs of the invalid links.
+	"""
+
+	invalid_sources = set()
+	linkstodrop = set()
+
+	for i, source in enumerate(sources):
+		if not source_preprocessing(source, datatype, linkstodrop):
+			invalid_sources.add(offset + i)
+
+	return invalid_sources, linkstodrop
+
+
+def remove_invalid_sources(data, invalid_sources):
+	"""
+	Removes the invalid sources from the data and creates a NumericID attribute for the valid ones.
+	
+	:param data: A dictionary containing the collection of sources.
+	:param invalid_sources: A set with the indexes of the invalid sources.
+	"""
 
 	# Remove invalid sources from data
 	for i in sorted(invalid_sources, reverse=True):
@@ -155,6 +240,167 @@ def collection_preprocessing(data, datatype, linkstodrop):
 		data['Sources'][i] = {'NumericID': i + 1, **data['Sources'][i]}
 
 
+def collection_preprocessing(data, datatype, linkstodrop):
+	"""
+	Checks whether the data contains invalid sources and removes them (see `source_preprocessing`).
+	
+	:param data: A dictionary containing the collection of sources.
+	:param datatype: A string that specifies the type of data being processed. 
+	:param linkstodrop: A set that stores the URLs of the invalid links to be removed from the `links` collection.
+	"""
+	
+	# Check if every source is valid or not
+	invalid_sources, invalid_links = validate_sources(data['Sources'], datatype)
+	linkstodrop.update(invalid_links)
+
+	remove_invalid_sources(data, invalid_sources)
+
+
+def parallel_collection_preprocessing(collections, linkstodrop, workers, shardsize):
+	"""
+	Parallel version of `collection_preprocessing`, that validates many collections concurrently using a pool 
+	of processes. Large collections are split into shards of consecutive sources, and each worker returns the 
+	invalid sources and links of its own shard, which are then merged.
+	
+	:param collections: A dictionary mapping the type of data being processed to the dictionary containing its collection of sources.
+	:param linkstodrop: A set that stores the URLs of the invalid links to be removed from the `links` collection.
+	:param workers: An integer specifying the number of worker processes.
+	:param shardsize: An integer specifying the maximum number of sources validated by each worker task.
+	"""
+
+	invalid_sources = {datatype: set() for datatype in collections}
+
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		futures = {}
+		for datatype, data in collections.items():
+			for offset in range(0, len(data['Sources']), shardsize):
+				shard = data['Sources'][offset:offset + shardsize]
+				futures[executor.submit(validate_sources, shard, datatype, offset)] = datatype
+
+		# Merge the partial results of the workers
+		for future in as_completed(futures):
+			shard_invalid_sources, shard_linkstodrop = future.result()
+			invalid_sources[futures[future]].update(shard_invalid_sources)
+			linkstodrop.update(shard_linkstodrop)
+
+	# Remove invalid sources in the parent, so that NumericID assignment stays deterministic
+	for datatype, data in collections.items():
+		remove_invalid_sources(data, invalid_sources[datatype])
+
+
+def iter_sources(infile, buffersize=1 << 20):
+	"""
+	Parses the `Sources` array of a snapshot file incrementally, yielding one source at a time,
+	so that the whole file never has to be held in memory.
+	
+	:param infile: A text file object of a snapshot file, containing a JSON object with a `Sources` array.
+	:param buffersize: An integer specifying the number of characters read from the file at a time.
+	:returns: A generator of dictionaries, each representing one source of the collection.
+	"""
+
+	decoder = json.JSONDecoder()
+	buffer = ''
+	pos = None
+
+	# Read until the opening bracket of the `Sources` array is found
+	while pos is None:
+		chunk = infile.read(buffersize)
+		if not chunk:
+			return
+		buffer += chunk
+		match = re.search(r'"Sources"\s*:\s*\[', buffer)
+		if match:
+			pos = match.end()
+
+	while True:
+		# Skip the whitespace and the commas between the array elements
+		while True:
+			while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+				pos += 1
+			if pos < len(buffer):
+				break
+			chunk = infile.read(buffersize)
+			if not chunk:
+				return
+			buffer, pos = chunk, 0
+
+		# End of the `Sources` array
+		if buffer[pos] == ']':
+			return
+
+		# Decode the next source, reading more of the file while it is incomplete
+		readsize = buffersize
+		while True:
+			try:
+				source, end = decoder.raw_decode(buffer, pos)
+				break
+			except json.JSONDecodeError:
+				chunk = infile.read(readsize)
+				if not chunk:
+					raise
+				buffer = buffer[pos:] + chunk
+				pos = 0
+				readsize *= 2 # Avoid re-parsing large sources too many times
+
+		yield source
+
+		# Drop the consumed part of the buffer only once it is large, instead of copying the buffer after every source
+		pos = end
+		if pos > buffersize:
+			buffer = buffer[pos:]
+			pos = 0
+
+
+def iter_unique(sources, attribute, duplicate_links):
+	"""
+	Streaming version of `remove_duplicates`. Yields only the first occurence of each source,
+	based on a specified attribute.
+	
+	:param sources: An iterable of dictionaries. Each dictionary represents an entry in the collection
+	:param attribute: A string specifying the attribute to be used to determine if there are duplicates
+	:param duplicate_links: A list that stores the URLs that correspond to the duplicate entries
+	:returns: A generator of the unique entries of the collection.
+	"""
+
+	unique_entries = set()
+
+	for entry in sources:
+		value = entry[attribute]
+
+		if value not in unique_entries:
+			unique_entries.add(value)
+			yield entry
+		else:
+			duplicate_links.append(entry['ChatgptSharing'][0]['URL'])
+
+
+def iter_valid_chunks(sources, datatype, linkstodrop, chunksize):
+	"""
+	Streaming version of `collection_preprocessing`. Validates the sources one at a time and yields
+	the valid ones in chunks of a fixed size, with their NumericID attribute already assigned.
+	
+	:param sources: An iterable of dictionaries, each representing one source of the collection.
+	:param datatype: A string that specifies the type of data being processed. 
+	:param linkstodrop: A set that stores the URLs of the invalid links to be removed from the `links` collection.
+	:param chunksize: An integer specifying the maximum number of sources contained in each chunk.
+	:returns: A generator of lists of valid sources.
+	"""
+
+	chunk = []
+	numericid = 0
+
+	for source in sources:
+		if source_preprocessing(source, datatype, linkstodrop):
+			numericid += 1
+			chunk.append({'NumericID': numericid, **source})
+			if len(chunk) >= chunksize:
+				yield chunk
+				chunk = []
+
+	if chunk:
+		yield chunk
+
+
 def remove_duplicates(collection, attribute):
 	"""
 	This function takes a collection of entries and removes duplicates based on a
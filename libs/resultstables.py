@@ -0,0 +1,181 @@
+import os
+import numpy as np
+
+# Define the columns of each results table: (column name, NumPy type)
+tables = {
+	# One row for every commit
+	'commits': [
+		('URL', str),
+		('Category', str), # Annotation category of the commit's conversation ('' if not annotated)
+		('Language', str), # '' if not detected
+		('Analyzed', bool), # Whether the commit has AnalysisFeatures
+	],
+	# One row for every committed file of the analyzed commits (`AnalysisFeatures.FileAnalysis`)
+	'files': [
+		('CommitIdx', np.int64), # Row of the commit in the commits table
+		('Filename', str),
+		('LinesCopied', np.int64),
+		('DuplicateRatio', np.float64),
+		('CodeBlockIdx', np.int64),
+		('PromptsBeforeClone', np.int64),
+		('QualityAnalyzed', bool), # Whether the violations of the two versions of the file were found
+		('CurrentViolations', np.int64),
+		('PreviousViolations', np.int64),
+		('HasPreviousContent', bool), # Whether the previous version of the file exists
+	],
+	# One row for every generated code block
+	'blocks': [
+		('CommitIdx', np.int64), # Row of the commit in the commits table
+		('ConversationIdx', np.int64),
+		('BlockIdx', np.int64), # Index of the code block in its conversation
+		('Type', str),
+		('HasViolations', bool), # Whether the quality violations of the code block were found
+		('TotalViolations', np.int64),
+		('BestPractices', np.int64),
+		('CodeStyle', np.int64),
+		('ErrorProne', np.int64),
+	],
+}
+
+# Define the fields of the commits that are needed for the tables. Of the quality analysis of each file, only the number of
+# violations and whether the previous version exists are returned, not the previous version itself
+projection = {
+	'URL': True,
+	'Annotation': True,
+	'Language': True,
+	'AnalysisFeatures': {'$cond': [
+		{'$eq': [{'$type': '$AnalysisFeatures'}, 'missing']},
+		'$$REMOVE',
+		{'FileAnalysis': {'$map': {
+			'input': {'$ifNull': ['$AnalysisFeatures.FileAnalysis', []]},
+			'as': 'file',
+			'in': {
+				'Filename': '$$file.Filename',
+				'LinesCopied': '$$file.LinesCopied',
+				'DuplicateRatio': '$$file.DuplicateRatio',
+				'CodeBlockIdx': '$$file.CodeBlockIdx',
+				'PromptsBeforeClone': '$$file.PromptsBeforeClone',
+				'QualityAnalysis': {'$cond': [
+					{'$eq': [{'$type': '$$file.QualityAnalysis'}, 'object']},
+					{
+						'Current': '$$file.QualityAnalysis.Current',
+						'Previous': '$$file.QualityAnalysis.Previous',
+						'HasPreviousContent': {'$gt': [{'$strLenCP': {'$ifNull': ['$$file.QualityAnalysis.PreviousContent', '']}}, 0]},
+					},
+					'$$REMOVE',
+				]},
+			},
+		}}},
+	]},
+	'ChatgptSharing.Conversations.ListOfCode.Type': True,
+	'ChatgptSharing.Conversations.ListOfCode.Violations.Total': True,
+	'ChatgptSharing.Conversations.ListOfCode.Violations.ViolationsByCat': True,
+}
+
+def get_table_rows(commits):
+	"""
+	This function flattens the analysis results of the commits into the rows of the results tables (see `tables`).
+
+	:param commits: An iterable of dictionaries, each representing one commit, as returned by the `$project` stage of `projection`.
+	:returns: A dictionary mapping the name of each table to its list of rows. Each row is a tuple of the values of its columns.
+	"""
+
+	rows = {name: [] for name in tables}
+
+	for commit_idx, commit in enumerate(commits):
+		rows['commits'].append((commit['URL'], commit.get('Annotation', ''), commit.get('Language', ''), 'AnalysisFeatures' in commit))
+
+		for file in commit.get('AnalysisFeatures', {}).get('FileAnalysis', []):
+			quality = file.get('QualityAnalysis')
+			quality_analyzed = isinstance(quality, dict)
+			rows['files'].append((
+				commit_idx,
+				file['Filename'],
+				file.get('LinesCopied', 0),
+				file.get('DuplicateRatio', 0),
+				file.get('CodeBlockIdx', 0),
+				file.get('PromptsBeforeClone', 0),
+				quality_analyzed,
+				quality['Current'] if quality_analyzed else 0,
+				quality['Previous'] if quality_analyzed else 0,
+				quality_analyzed and quality['HasPreviousContent'],
+			))
+
+		# All commits contain only one shared link
+		for conversation_idx, conversation in enumerate(commit['ChatgptSharing'][0].get('Conversations', [])):
+			for block_idx, code in enumerate(conversation['ListOfCode']):
+				violations = code.get('Violations', {})
+				violations_by_cat = violations.get('ViolationsByCat', {})
+				rows['blocks'].append((
+					commit_idx,
+					conversation_idx,
+					block_idx,
+					code.get('Type') or '',
+					'Violations' in code,
+					violations.get('Total', 0),
+					violations_by_cat.get('BestPractices', 0),
+					violations_by_cat.get('CodeStyle', 0),
+					violations_by_cat.get('ErrorProne', 0),
+				))
+
+	return rows
+
+
+def build_tables(commits):
+	"""
+	This function builds the results tables (see `tables`) of the commits, in memory.
+
+	:param commits: An iterable of dictionaries, each representing one commit, as returned by the `$project` stage of `projection`.
+	:returns: A dictionary mapping the name of each table to its columns (a dictionary mapping the name of each column to its NumPy array).
+	"""
+
+	rows = get_table_rows(commits)
+
+	results_tables = {}
+	for name, columns in tables.items():
+		values = list(zip(*rows[name])) or [()] * len(columns)
+		results_tables[name] = {column: np.array(column_values, dtype=dtype) for (column, dtype), column_values in zip(columns, values)}
+	return results_tables
+
+
+def scan_tables(db):
+	"""
+	This function builds the results tables of the commits collection with a single pass over the collection, in its order.
+	Only the fields needed for the tables are returned by the database (see `projection`).
+	"""
+
+	return build_tables(db['commits'].aggregate([{'$sort': {'_id': 1}}, {'$project': projection}]))
+
+
+def export_tables(db, tablespath):
+	"""
+	This function exports the analysis results of the commits collection to columnar tables, one NumPy `.npz` file for
+	each table, with one array for each column (see `scan_tables`).
+
+	:param db: The MongoDB database.
+	:param tablespath: A string that specifies the folder where the tables are saved.
+	:returns: A dictionary mapping the name of each table to its number of rows.
+	"""
+
+	os.makedirs(tablespath, exist_ok=True)
+	results_tables = scan_tables(db)
+
+	for name, columns in results_tables.items():
+		np.savez_compressed(os.path.join(tablespath, f"{name}.npz"), **columns)
+
+	return {name: len(next(iter(columns.values()))) for name, columns in results_tables.items()}
+
+
+def load_tables(tablespath):
+	"""
+	This function loads the exported results tables.
+
+	:param tablespath: A string that specifies the folder where the tables are saved.
+	:returns: A dictionary mapping the name of each table to its columns (a dictionary mapping the name of each column to its NumPy array).
+	"""
+
+	results_tables = {}
+	for name in tables:
+		with np.load(os.path.join(tablespath, f"{name}.npz"), allow_pickle=False) as table:
+			results_tables[name] = {column: table[column] for column in table.files}
+	return results_tables
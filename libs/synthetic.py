@@ -0,0 +1,291 @@
+import os
+import sys
+import csv
+import json
+import stat
+import random
+from libs.download import ResponseCache
+
+# Define the snapshot collections: (type of data, snapshot file, mentioned source of its links)
+collections = [
+	("discussion", "discussion_sharings.json", "discussion"),
+	("pull-req", "pr_sharings.json", "pull request"),
+	("issue", "issue_sharings.json", "issue"),
+	("commit", "commit_sharings.json", "commit"),
+	("file", "file_sharings.json", "code file"),
+	("hacker-news", "hn_sharings.json", "hacker news"),
+]
+
+# Define the lines used to generate code (JavaScript-like, to exercise the quality analysis rules)
+codelines = [
+	"var {0} = {1};",
+	"let {0} = [];",
+	"const {0} = require('{0}');",
+	"if ({0} == {1}) {{",
+	"if ({0}) {2}();",
+	"for (var i = 0; i < {1}; i++) {{",
+	"{0}.push({1});",
+	"return {0};",
+	"}}",
+	"console.log({0});",
+	"function {2}({0}) {{",
+	"with ({0}) {{}}",
+	"{0}++;",
+	"",
+]
+
+identifiers = ["a", "b", "x", "items", "count", "result", "value", "data", "user", "config"]
+
+# Define characters that are invalid for the preprocessing (see `libs.preprocessing`), and valid non-ASCII characters
+invalidchars = ["一", "あ", "가"]
+validchars = ["é", "→", "─", "★"]
+
+
+def generate_code(rng, lines):
+	"""
+	Generates a code block of the given number of lines.
+	"""
+	return '\n'.join(
+		rng.choice(codelines).format(rng.choice(identifiers), rng.randint(0, 100), rng.choice(identifiers) + "Fn")
+		for _ in range(lines)
+	)
+
+
+def generate_text(rng, words, invalid_rate):
+	"""
+	Generates a text of the given number of words, that contains an invalid character with probability `invalid_rate`.
+	"""
+	text = [rng.choice(identifiers + ["the", "code", "please", "fix", "write", "error", "function"]) for _ in range(words)]
+	if rng.random() < 0.2:
+		text.insert(rng.randrange(len(text) + 1), rng.choice(validchars))
+	if rng.random() < invalid_rate:
+		text.insert(rng.randrange(len(text) + 1), rng.choice(invalidchars))
+	return ' '.join(text)
+
+
+def generate_sharing(rng, url, invalid_rate):
+	"""
+	Generates a shared ChatGPT link, with its conversations and their code blocks.
+	"""
+	conversations = []
+	for _ in range(rng.randint(1, 4)):
+		listofcode = [
+			{'ReplaceString': '[CODE_BLOCK_0]', 'Type': rng.choice(["javascript", "javascript", "python", "sh", "html"]), 'Content': generate_code(rng, rng.randint(1, 30))}
+			for _ in range(rng.choice([0, 1, 1, 2, 3]))
+		]
+		conversations.append({
+			'Prompt': generate_text(rng, rng.randint(5, 60), invalid_rate / 4),
+			'Answer': generate_text(rng, rng.randint(20, 200), invalid_rate / 4),
+			'ListOfCode': listofcode,
+		})
+
+	return {
+		'URL': url,
+		'Status': 200 if rng.random() < 0.9 else 404,
+		'DateOfConversation': "September 1, 2023",
+		'NumberOfPrompts': len(conversations),
+		'TokensOfPrompts': rng.randint(10, 1000),
+		'TokensOfAnswers': rng.randint(10, 5000),
+		'Model': "Default (GPT-3.5)",
+		'Conversations': conversations,
+	}
+
+
+def generate_source(rng, datatype, i, invalid_rate=0.05, duplicate_rate=0.02):
+	"""
+	Generates a DevGPT-shaped source of a collection.
+
+	:param rng: The `random.Random` generator.
+	:param datatype: A string that specifies the type of data of the collection (see `collections`).
+	:param i: An integer, the index of the source in its collection.
+	:param invalid_rate: A float, the probability of a text field of the source to contain an invalid character.
+	:param duplicate_rate: A float, the probability of a commit to have the Sha of a previous commit.
+	:returns: A dictionary representing the source.
+	"""
+
+	reponame = "tisztamo/Junior" if rng.random() < 0.02 else f"owner{i % 97}/repo{i % 89}"
+	url = f"https://github.com/{reponame}/{datatype}/{i}"
+	source = {'Type': datatype, 'URL': url, 'Author': f"user{i % 1000}", 'RepoName': reponame, 'RepoLanguage': "JavaScript"}
+
+	if datatype in ("discussion", "issue", "pull-req"):
+		source['Title'] = generate_text(rng, rng.randint(3, 12), invalid_rate)
+		source['Body'] = generate_text(rng, rng.randint(10, 100), invalid_rate)
+	elif datatype == "commit":
+		sha = f"{(rng.randrange(i) if i and rng.random() < duplicate_rate else i):040x}"
+		source['Sha'] = sha
+		source['URL'] = f"https://github.com/{reponame}/commit/{sha}"
+		source['Message'] = generate_text(rng, rng.randint(3, 20), invalid_rate)
+	elif datatype == "file":
+		source['CommitMessage'] = generate_text(rng, rng.randint(3, 20), invalid_rate)
+	elif datatype == "hacker-news":
+		source['Title'] = generate_text(rng, rng.randint(3, 12), invalid_rate) if rng.random() < 0.9 else None
+
+	source['ChatgptSharing'] = [generate_sharing(rng, f"https://chat.openai.com/share/{datatype}-{i}-{j}", invalid_rate) for j in range(rng.choice([1, 1, 1, 2]))]
+	return source
+
+
+def generate_patch(rng, codeblocks, lines):
+	"""
+	Generates the patch of a committed file (unified diff format), whose added lines are partly copied from the code blocks.
+	"""
+	patch = [f"@@ -1,{lines} +1,{lines} @@"]
+	while len(patch) <= lines:
+		if codeblocks and rng.random() < 0.3:
+			# Copy some consecutive lines of a code block
+			blocklines = rng.choice(codeblocks).splitlines()
+			start = rng.randrange(len(blocklines)) if blocklines else 0
+			patch.extend('+' + line for line in blocklines[start:start + rng.randint(1, 10)])
+		else:
+			patch.append(rng.choice(['+', '-', ' ', ' ']) + generate_code(rng, 1))
+	return '\n'.join(patch)
+
+
+def generate_commit_content(rng, source):
+	"""
+	Generates the response of GitHub's API for a commit (see `libs.download`), with the patches of its committed files.
+	"""
+	codeblocks = [code['Content'] for sharing in source['ChatgptSharing'] for conversation in sharing['Conversations'] for code in conversation['ListOfCode']]
+	files = []
+	for k in range(rng.randint(1, 4)):
+		filename = f"src/file{k}" + rng.choice([".js", ".js", ".py", ".md", ".json"])
+		lines = rng.randint(1, 80)
+		files.append({'sha': f"{rng.getrandbits(160):040x}", 'filename': filename, 'status': "modified", 'additions': lines, 'deletions': 0, 'changes': lines, 'patch': generate_patch(rng, codeblocks, lines)})
+	return {'sha': source['Sha'], 'commit': {'message': source['Message']}, 'stats': {'total': sum(file['changes'] for file in files)}, 'files': files}
+
+
+def generate_collection(datatype, size, seed=0):
+	"""
+	Generates the sources of a collection (see `generate_source`), with a generator seeded by `seed` and the type of data.
+
+	:returns: A generator of the sources.
+	"""
+	rng = random.Random(f"{seed}-{datatype}")
+	for i in range(size):
+		yield generate_source(rng, datatype, i)
+
+
+def generate_snapshot(datasetpath, size, seed=0, snapshot="snapshot_20230914"):
+	"""
+	Generates a synthetic DevGPT snapshot, with `size` sources in total, split equally between the collections. The snapshot files
+	are written incrementally, so that large snapshots do not have to fit in memory. Also, the responses of GitHub's API for the
+	commits are stored to a `ResponseCache` (in the 'commitcache' folder of the dataset), so that they are never requested.
+
+	:param datasetpath: A string that specifies the folder of the dataset.
+	:param size: An integer specifying the total number of sources, e.g. 10**3 to 10**6.
+	:param seed: The seed of the generator. The same seed generates the same snapshot.
+	:param snapshot: The name of the snapshot folder.
+	:returns: A dictionary mapping each type of data to the number of generated sources.
+	"""
+
+	snapshotpath = os.path.join(datasetpath, snapshot)
+	os.makedirs(snapshotpath, exist_ok=True)
+	date = snapshot.split('_')[-1]
+	cache = ResponseCache(os.path.join(datasetpath, "commitcache"))
+	rng = random.Random(seed)
+
+	counts = {}
+	with open(os.path.join(snapshotpath, f"{date}_Link_sharings.csv"), 'w', encoding='utf-8', newline='') as linksfile:
+		links = csv.DictWriter(linksfile, ['URL', 'MentionedURL', 'MentionedProperty', 'MentionedAuthor', 'MentionedText', 'MentionedPath', 'MentionedSource'], extrasaction='ignore')
+		links.writeheader()
+
+		for i, (datatype, filename, mentionedsource) in enumerate(collections):
+			collectionsize = size // len(collections) + (1 if i < size % len(collections) else 0)
+			with open(os.path.join(snapshotpath, f"{date}_{filename}"), 'w', encoding='utf-8') as outfile:
+				outfile.write('{"Sources": [')
+				for j, source in enumerate(generate_collection(datatype, collectionsize, seed)):
+					outfile.write((',\n' if j else '\n') + json.dumps(source, ensure_ascii=False))
+					for sharing in source['ChatgptSharing']:
+						links.writerow({'URL': sharing['URL'], 'MentionedURL': source['URL'], 'MentionedSource': mentionedsource})
+					if datatype == "commit":
+						apiurl = "https://api.github.com/repos/" + source['RepoName'] + "/commits/" + source['Sha']
+						cache.put(apiurl, generate_commit_content(rng, source))
+				outfile.write('\n]}')
+			counts[datatype] = collectionsize
+
+	return counts
+
+
+# Define the stub of Simian, that reports the runs of equal lines between the given files in Simian's output format
+simianstub = '''
+import sys
+sys.path.insert(0, {root!r})
+from libs.codeanalysis import normalize_lines, find_duplicate_runs
+
+args = [arg for arg in sys.argv[1:] if arg != '-jar'][1:]
+threshold = int(next(arg for arg in args if arg.startswith('-threshold=')).split('=')[1])
+files = [arg for arg in args if not arg.startswith('-')]
+lines = {{}}
+for path in files:
+	with open(path, encoding='cp437') as infile:
+		lines[path] = normalize_lines(infile.read())
+
+output = ["Similarity Analyser 4.0.0 - http://www.harukizaemon.com/simian", "{{threshold=%d}}" % threshold]
+total = 0
+for a in range(len(files)):
+	for b in range(a + 1, len(files)):
+		lines1, lines2 = lines[files[a]], lines[files[b]]
+		for start1, start2, length in find_duplicate_runs(lines1, lines2, threshold):
+			output.append(f"Found {{length}} duplicate lines in the following files:")
+			output.append(f" Between lines {{lines1[start1][0] + 1}} and {{lines1[start1 + length - 1][0] + 1}} in {{files[a]}}")
+			output.append(f" Between lines {{lines2[start2][0] + 1}} and {{lines2[start2 + length - 1][0] + 1}} in {{files[b]}}")
+			total += length
+output.append(f"Found {{total}} duplicate lines in {{len(files)}} files")
+print("\\n".join(output))
+sys.exit(1 if total else 0)
+'''
+
+# Define the stub of PMD, that reports some of the supported rules by matching the lines of the given files, in PMD's JSON report format
+pmdstub = '''
+import os
+import sys
+import json
+
+args = sys.argv[1:]
+path = args[args.index('-d') + 1]
+files = [os.path.join(path, name) for name in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+rules = [('if (', 'IfStmtsMustUseBraces', 'Code Style'), ('var ', 'GlobalVariable', 'Best Practices'), (' == ', 'EqualComparison', 'Error Prone'), ('with (', 'AvoidWithStatement', 'Best Practices')]
+report = []
+for filename in files:
+	with open(filename, encoding='cp437') as infile:
+		violations = [
+			{{'beginline': i + 1, 'rule': rule, 'ruleset': ruleset, 'description': rule}}
+			for i, line in enumerate(infile.read().splitlines())
+			for pattern, rule, ruleset in rules if pattern in line
+		]
+	if violations:
+		report.append({{'filename': filename, 'violations': violations}})
+print(json.dumps({{'formatVersion': 0, 'files': report}}))
+sys.exit(4 if report else 0)
+'''
+
+
+def write_stub_tools(stubpath):
+	"""
+	Writes executable stubs of Java (running Simian) and PMD, that emulate the output of the tools, so that the code clone detection
+	and the quality analysis can run without them.
+
+	:param stubpath: A string that specifies the folder of the stubs.
+	:returns: A tuple containing the paths of the Java and the PMD stubs.
+	"""
+
+	os.makedirs(stubpath, exist_ok=True)
+	root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	paths = []
+	for name, source in (("java", simianstub), ("pmd", pmdstub)):
+		scriptpath = os.path.join(stubpath, f"{name}_stub.py")
+		with open(scriptpath, 'w', encoding='utf-8') as outfile:
+			outfile.write(source.format(root=root))
+
+		# Create an executable that runs the stub with the current interpreter
+		if os.name == 'nt':
+			path = os.path.join(stubpath, f"{name}.bat")
+			with open(path, 'w') as outfile:
+				outfile.write(f'@"{sys.executable}" "{scriptpath}" %*\n')
+		else:
+			path = os.path.join(stubpath, name)
+			with open(path, 'w') as outfile:
+				outfile.write(f'#!/bin/sh\nexec "{sys.executable}" "{scriptpath}" "$@"\n')
+			os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+		paths.append(path)
+
+	return tuple(paths)
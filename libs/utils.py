@@ -1,6 +1,94 @@
+import os
 import re
+import json
+import fnmatch
+import pygments
 from pygments import lexers
 from collections import Counter
+from properties import languagetablepath
+
+# Define a regular expression pattern to capture the line ranges of a hunk header, e.g. "@@ -1,5 +1,7 @@"
+hunk_header_pattern = re.compile(r'@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+# Create dictionary to cache the parsed patches, in the order they were last used: (commit sha, filename) -> parsed patch
+parsed_patches = {}
+parsed_patches_size = 1024
+
+# Define a regular expression pattern to find the wildcards of a filename pattern
+glob_chars_pattern = re.compile(r'[*?\[]')
+
+# The table that maps filenames to lexers (see `load_extension_table`), and the memoized file extension of each filename
+extension_table = None
+file_extensions = {}
+
+def parse_patch(patch):
+	"""
+	This function parses the patch of a committed file (unified diff format) in a single pass, and reconstructs
+	both versions of the file's content from it. Context lines are kept as they appear in the patch, and
+	"\\ No newline at end of file" markers are not part of either version.
+	
+	:param patch: A string that represents the patch of a GitHub's commit for a specific file.
+	:returns: A dictionary with the following keys:
+		- Current: A string with the content of the current version of the file (the lines of all hunks)
+		- Previous: A string with the content of the previous version of the file
+		- Hunks: A list with the line ranges of each hunk, as dictionaries with the keys PreviousStart, PreviousLength, 
+		CurrentStart and CurrentLength (the start lines are 1-based line numbers of the whole file)
+		- AddedLines: A list with the (0-based) indexes of the added lines in the lines of the current version
+	"""
+
+	current_lines = []
+	previous_lines = []
+	hunks = []
+	added_lines = []
+
+	for line in patch.splitlines():
+		marker = line[:1]
+		if marker == '+':
+			added_lines.append(len(current_lines))
+			current_lines.append(line[1:])
+		elif marker == '-':
+			previous_lines.append(line[1:])
+		elif marker == '@':
+			match = hunk_header_pattern.match(line)
+			if match:
+				previous_start, previous_length, current_start, current_length = match.groups()
+				hunks.append({
+					'PreviousStart': int(previous_start),
+					'PreviousLength': int(previous_length or 1),
+					'CurrentStart': int(current_start),
+					'CurrentLength': int(current_length or 1),
+				})
+		elif marker != '\\':
+			# Context line (an empty line is an empty context line) belongs to both versions
+			current_lines.append(line)
+			previous_lines.append(line)
+
+	return {'Current': '\n'.join(current_lines), 'Previous': '\n'.join(previous_lines), 'Hunks': hunks, 'AddedLines': added_lines}
+
+
+def get_parsed_patch(sha, file):
+	"""
+	This function returns the parsed patch of a committed file (see `parse_patch`). The parsed patches are cached
+	by commit sha and filename, so that every analysis step of a commit reuses them instead of parsing the patch again.
+	
+	:param sha: The sha of the commit (if None, the patch is parsed without caching).
+	:param file: A dictionary that represents a committed file, with its 'filename' and 'patch'.
+	:returns: The parsed patch of the file.
+	"""
+
+	if sha is None:
+		return parse_patch(file['patch'])
+
+	key = (sha, file['filename'])
+	parsed = parsed_patches.pop(key, None)
+	if parsed is None:
+		parsed = parse_patch(file['patch'])
+		if len(parsed_patches) >= parsed_patches_size:
+			# Remove the least recently used patch
+			parsed_patches.pop(next(iter(parsed_patches)))
+	parsed_patches[key] = parsed
+	return parsed
+
 
 def get_content_from_patch(patch, version):
 	"""
@@ -13,44 +101,119 @@ def get_content_from_patch(patch, version):
 	:returns: the content of the file based on the given patch and version.
 	"""
 
-	patch_lines = patch.splitlines()
-	content_lines = []
+	return parse_patch(patch)[version.capitalize()]
+	
+
+def build_extension_table():
+	"""
+	This function builds the table that maps filenames to lexers, from the filename patterns of all pygments lexers
+	(the same metadata that `get_lexer_for_filename` matches). Each pattern is stored with the rating that
+	`get_lexer_for_filename` gives to its lexer, and the first filename pattern of the lexer (see `get_file_extension`).
+	
+	:returns: A dictionary with the following keys:
+		- Version: The version of pygments and its lexer plugins, that the table was built from
+		- Names: A dictionary mapping the exact filenames (patterns without wildcards, e.g. 'Makefile') to their entries
+		- Suffixes: A dictionary mapping the suffixes of the patterns that are a wildcard followed by a suffix (e.g. '*.js') to their entries
+		- Globs: A list with the remaining patterns and their entries
+	Each entry is a list: [rating, lexer class name, order of the pattern in pygments, first filename pattern of the lexer].
+	"""
+
+	lexer_classes = [lexers.find_lexer_class(name) for _, name, _, _, _ in lexers.LEXERS.values()]
+	plugin_classes = list(lexers.find_plugin_lexers())
+
+	table = {'Version': get_extension_table_version(plugin_classes), 'Names': {}, 'Suffixes': {}, 'Globs': []}
+	order = 0
+	for lexer_class in lexer_classes + plugin_classes:
+		for pattern in lexer_class.filenames:
+			# Explicit patterns get a bonus (as in `get_lexer_for_filename`)
+			entry = [lexer_class.priority + (0.5 if '*' not in pattern else 0), lexer_class.__name__, order, lexer_class.filenames[0]]
+			order += 1
+			if not glob_chars_pattern.search(pattern):
+				table['Names'].setdefault(pattern, []).append(entry)
+			elif pattern[0] == '*' and not glob_chars_pattern.search(pattern[1:]):
+				table['Suffixes'].setdefault(pattern[1:], []).append(entry)
+			else:
+				table['Globs'].append([pattern] + entry)
+	return table
 
-	if version == 'current':
-		# Specify which patch lines belongs to current version of the file
-		for line in patch_lines:
-			if line[0] == '+':
-				content_lines.append(line[1:])
-			elif line[0] != '@' and line[0] != '-':
-				content_lines.append(line)
 
-	elif version == 'previous':
-		# Specify which patch lines belongs to previous version of the file
-		for line in patch_lines:
-			if line[0] == '-':
-				content_lines.append(line[1:])
-			elif line[0] != '@' and line[0] != '+':
-				content_lines.append(line)
+def get_extension_table_version(plugin_classes=None):
+	"""
+	Returns the version of pygments and its lexer plugins, so that a persisted extension table is rebuilt when they change.
+	"""
+
+	if plugin_classes is None:
+		plugin_classes = lexers.find_plugin_lexers()
+	return ' '.join([pygments.__version__] + sorted(f"{cls.__module__}.{cls.__name__}" for cls in plugin_classes))
 
-	content = '\n'.join(content_lines)
-	return content
+
+def load_extension_table(tablepath=None):
+	"""
+	This function loads the table that maps filenames to lexers (see `build_extension_table`), once per process.
+	If `tablepath` is given, the table is read from that file, and built and written to it if the file does not exist
+	or was built from another version of pygments.
 	
+	:param tablepath: A string that specifies the JSON file of the persisted table (optional).
+	:returns: The table, with the compiled regular expressions of its glob patterns.
+	"""
+
+	global extension_table
+
+	if extension_table is not None:
+		return extension_table
+
+	table = None
+	if tablepath and os.path.exists(tablepath):
+		with open(tablepath, 'r') as infile:
+			table = json.load(infile)
+		if table.get('Version') != get_extension_table_version():
+			table = None
+
+	if table is None:
+		table = build_extension_table()
+		if tablepath:
+			# Write to a temporary file first, so that concurrent processes never read a partial table
+			temp_path = f"{tablepath}.{os.getpid()}.tmp"
+			with open(temp_path, 'w') as outfile:
+				json.dump(table, outfile)
+			os.replace(temp_path, tablepath)
+
+	table['SuffixLengths'] = sorted({len(suffix) for suffix in table['Suffixes']})
+	table['Globs'] = [(re.compile(fnmatch.translate(pattern)), entry) for pattern, *entry in table['Globs']]
+	extension_table = table
+	return table
+
 
 def get_file_extension(filename):
 	"""
-	This function attempts to determine the file extension of a given filename by
-	using the `get_lexer_for_filename` function from the `lexers` module.
+	This function attempts to determine the file extension of a given filename, as the first filename pattern of
+	the lexer that pygments' `get_lexer_for_filename` function selects for it. Instead of matching the filename against
+	the patterns of every lexer, the lexer is found in a precomputed table (see `load_extension_table`), and the result
+	is memoized for every filename.
 	
 	:param filename: A string that represents the name of a file, including its extension
 	:returns: The file extension of the given filename if it can be determined by the `lexers` module. 
-	If the file extension cannot be determined or an exception occurs, it returns `None`.
+	If the file extension cannot be determined, it returns `None`.
 	"""
 
-	try:
-		lexer = lexers.get_lexer_for_filename(filename)
-		return lexer.filenames[0]
-	except Exception as e:
-		return None
+	name = os.path.basename(filename)
+	if name in file_extensions:
+		return file_extensions[name]
+
+	table = load_extension_table(languagetablepath)
+
+	# Find the entries of all patterns that match the filename
+	entries = list(table['Names'].get(name, []))
+	for length in table['SuffixLengths']:
+		if length > len(name):
+			break
+		entries.extend(table['Suffixes'].get(name[len(name) - length:], []))
+	entries.extend(entry for regex, entry in table['Globs'] if regex.match(name))
+
+	# Select the lexer with the highest rating (ties are broken by the name of the lexer class and the order of the patterns, as in `get_lexer_for_filename`)
+	file_extension = max(entries, key=lambda entry: entry[:3])[3] if entries else None
+	file_extensions[name] = file_extension
+	return file_extension
 
 
 def detect_language(dbobj):
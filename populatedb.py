@@ -3,87 +3,219 @@ import csv
 import json
 import codecs
 from libs.dbmanager import DBManager
-from properties import datasetpath, snapshot, dbpath
-from libs.preprocessing import get_subpath, collection_preprocessing, links_preprocessing, remove_duplicates
-from libs.download import download_commits_content
+from properties import datasetpath, snapshot, dbpath, ingestchunksize, preprocessingworkers, incrementalingest, downloadworkers, commitcachepath, commitcacherevalidate, metricspath
+from libs.preprocessing import get_subpath, collection_preprocessing, parallel_collection_preprocessing, links_preprocessing, remove_duplicates, iter_sources, iter_unique, iter_valid_chunks
+from libs.download import download_commits_content, ResponseCache
+from libs.metrics import metrics
 
-# Connect to database
-dbmanager = DBManager(dbpath)
-dbmanager.drop_db()
+# Define the snapshot collections: (snapshot file, type of data, database collection, attribute used to remove duplicates)
+collections = [
+	('discussion', "discussion", "discussions", None),
+	('pr', "pull-req", "pull_requests", None),
+	('issue', "issue", "issues", None),
+	('commit', "commit", "commits", 'Sha'),
+	('file', "file", "files", None),
+	('hn', "hacker-news", "hacker-news", None),
+]
 
-# Find snapshots
-snapshots = [filename for filename in os.listdir(datasetpath) if filename.startswith("snapshot")]
+# Define the attribute that identifies the sources of each collection across snapshots (used for incremental ingest)
+sourceidentity = {"discussions": 'URL', "pull_requests": 'URL', "issues": 'URL', "commits": 'Sha', "files": 'URL', "hacker-news": 'URL'}
 
-print("\nLoading " + snapshot)
-snapshotpath = os.path.join(datasetpath, snapshot)
+# Define the attributes computed after ingest, that are removed when a source changed between snapshots
+resetfields = {"commits": ('Language', 'AnalysisFeatures')}
+
+# Define the maximum number of sources validated by each worker task, when preprocessing in parallel
+shardsize = 1000
 
 # Create set to store the links that need to be dropped (bad status code, no code blocks detected, or non utf-8 characters)
 linkstodrop = set()
 
-# --- Discussion sharings collection ---
-print("Loading discussions")
-with codecs.open(get_subpath(snapshotpath, 'discussion'), 'r', 'utf-8') as infile:
-	data = json.load(infile)
-collection_preprocessing(data, "discussion", linkstodrop) 
-dbmanager.add_data("discussions", data['Sources'])
-
-# --- Pull-request sharings collection ---
-print("Loading pull requests")
-with codecs.open(get_subpath(snapshotpath, 'pr'), 'r', 'utf-8') as infile:
-	data = json.load(infile)
-collection_preprocessing(data, "pull-req", linkstodrop)
-dbmanager.add_data("pull_requests", data['Sources'])
-
-# --- Issue sharings collection ---
-print("Loading issues")
-with codecs.open(get_subpath(snapshotpath, 'issue'), 'r', 'utf-8') as infile:
-	data = json.load(infile)
-collection_preprocessing(data, "issue", linkstodrop)
-dbmanager.add_data("issues", data['Sources'])
-
-#--- Commit sharings collection ---
-print("Loading commits")
-with codecs.open(get_subpath(snapshotpath, 'commit'), 'r', 'utf-8') as infile:
-	data = json.load(infile)
-data['Sources'], duplicatelinks = remove_duplicates(data['Sources'], 'Sha')
-collection_preprocessing(data, "commit", linkstodrop)
-dbmanager.add_data("commits", data['Sources'])
-
-# --- File sharings collection ---
-print("Loading files")
-with codecs.open(get_subpath(snapshotpath, 'file'), 'r', 'utf-8') as infile:
-	data = json.load(infile)
-collection_preprocessing(data, "file", linkstodrop)
-dbmanager.add_data("files", data['Sources'])
-
-# --- Hacker-news sharings collection ---
-print("Loading hacker news")
-with codecs.open(get_subpath(snapshotpath, 'hn'), 'r', 'utf-8') as infile:
-	data = json.load(infile)
-collection_preprocessing(data, "hacker-news", linkstodrop)
-dbmanager.add_data("hacker-news", data['Sources'])
-
-# --- Link sharing collection ---
-print("Loading links")
-with codecs.open(get_subpath(snapshotpath, 'Link'), 'r', 'utf-8') as infile:
-	data = csv.DictReader(infile)
-	validdata = links_preprocessing(data, linkstodrop, duplicatelinks)
-	dbmanager.add_data("links", validdata)
-
-# Enrich commits collection with commit content
-print("Downloading commits content")
-commitdocuments = dbmanager.get_all_documents("commits")
-updates = download_commits_content(commitdocuments)
-
-# Update the commits collection
-if updates != -1: # GitHub's Rate-Limit reached
-	for update in updates:
-		document_id = update['_id']
-		filter_condition = {'_id': document_id}
-		update_data = {'$set': {'CommitContent': update['CommitContent']}}
-		dbmanager.update("commits", filter_condition, update_data)
-else:
-	print('Download failed')
-
-# Close the DB connection
-dbmanager.close()
+# Create list to store the links of the duplicate commits
+duplicatelinks = []
+
+# Create dictionaries to store the ingest statistics and the keys of the ingested sources of each collection (incremental mode)
+ingeststats = {collection_name: {'Inserted': 0, 'Updated': 0, 'Unchanged': 0} for _, _, collection_name, _ in collections}
+ingestedkeys = {collection_name: set() for _, _, collection_name, _ in collections}
+
+def store_sources(collection_name, sources):
+	"""
+	Adds the valid sources of a collection to the database. In incremental mode, the sources are upserted
+	and the number of inserted, updated and unchanged sources is added to `ingeststats`.
+
+	:param collection_name: The name of the database collection to store the sources.
+	:param sources: A list of dictionaries, each representing one valid source.
+	"""
+
+	if not incrementalingest:
+		# Store the content hash of the sources, so that a later incremental ingest keeps the unchanged ones
+		dbmanager.add_data(collection_name, sources, source_hash=True)
+		return
+
+	key = sourceidentity[collection_name]
+	counts = dbmanager.upsert_data(collection_name, sources, key, resetfields.get(collection_name, ()))
+	for name, count in counts.items():
+		ingeststats[collection_name][name] += count
+	ingestedkeys[collection_name].update(source[key] for source in sources)
+
+
+def report_collection(collection_name):
+	"""
+	In incremental mode, removes the sources that are missing from the current snapshot and prints the ingest statistics of a collection.
+
+	:param collection_name: The name of the database collection.
+	"""
+
+	if not incrementalingest:
+		return
+
+	removed = dbmanager.remove_missing(collection_name, sourceidentity[collection_name], ingestedkeys[collection_name])
+	ingeststats[collection_name]['Removed'] = removed
+	print(collection_name + " - " + ", ".join(f"{name}: {count}" for name, count in ingeststats[collection_name].items()))
+
+
+def load_collection(datatype, sourcetype, collection_name, unique_attribute=None):
+	"""
+	Loads a snapshot collection, preprocesses it and adds it to the database. If `ingestchunksize` is set,
+	the snapshot file is parsed incrementally and the valid sources are inserted in chunks of that size.
+
+	:param datatype: A string that specifies the snapshot file of the collection.
+	:param sourcetype: A string that specifies the type of data being processed.
+	:param collection_name: The name of the database collection to store the sources.
+	:param unique_attribute: A string specifying the attribute used to remove duplicate sources, if any.
+	"""
+
+	with codecs.open(get_subpath(snapshotpath, datatype), 'r', 'utf-8') as infile:
+		if ingestchunksize:
+			sources = iter_sources(infile)
+			if unique_attribute:
+				sources = iter_unique(sources, unique_attribute, duplicatelinks)
+			chunks = iter_valid_chunks(sources, sourcetype, linkstodrop, int(ingestchunksize))
+			while True:
+				# The sources are parsed while they are validated, so parsing is part of this stage
+				with metrics.time('validate'):
+					chunk = next(chunks, None)
+				if chunk is None:
+					return
+				store_sources(collection_name, chunk)
+
+		data = json.load(infile)
+
+	if unique_attribute:
+		data['Sources'], duplicates = remove_duplicates(data['Sources'], unique_attribute)
+		duplicatelinks.extend(duplicates)
+	with metrics.time('validate'):
+		collection_preprocessing(data, sourcetype, linkstodrop)
+	store_sources(collection_name, data['Sources'])
+
+
+def load_collections_parallel():
+	"""
+	Loads all snapshot collections, preprocesses them concurrently using `preprocessingworkers` processes
+	and adds them to the database.
+	"""
+
+	loaded = {}
+	for datatype, sourcetype, collection_name, unique_attribute in collections:
+		print("Loading " + collection_name)
+		with codecs.open(get_subpath(snapshotpath, datatype), 'r', 'utf-8') as infile:
+			data = json.load(infile)
+		if unique_attribute:
+			data['Sources'], duplicates = remove_duplicates(data['Sources'], unique_attribute)
+			duplicatelinks.extend(duplicates)
+		loaded[sourcetype] = data
+
+	print("Preprocessing collections")
+	with metrics.time('validate'):
+		parallel_collection_preprocessing(loaded, linkstodrop, int(preprocessingworkers), shardsize)
+
+	for datatype, sourcetype, collection_name, unique_attribute in collections:
+		store_sources(collection_name, loaded[sourcetype]['Sources'])
+		report_collection(collection_name)
+
+
+def ingest_snapshot():
+	"""
+	Loads and preprocesses all collections of the working snapshot, adds them to the database and creates
+	the indexes. When done, records an 'Ingest' checkpoint, so that a rerun after an interrupted download does not load the snapshot again
+	(the checkpoint is cleared when the download completes).
+	"""
+
+	if not incrementalingest:
+		dbmanager.drop_db()
+	else:
+		# Indexes are needed to find the existing sources during the upserts
+		dbmanager.create_indexes()
+
+	# --- Discussion, pull-request, issue, commit, file and hacker-news sharings collections ---
+	if preprocessingworkers and not ingestchunksize:
+		load_collections_parallel()
+	else:
+		for datatype, sourcetype, collection_name, unique_attribute in collections:
+			print("Loading " + collection_name)
+			load_collection(datatype, sourcetype, collection_name, unique_attribute)
+			report_collection(collection_name)
+
+	# --- Link sharing collection ---
+	print("Loading links")
+	with codecs.open(get_subpath(snapshotpath, 'Link'), 'r', 'utf-8') as infile:
+		data = csv.DictReader(infile)
+		validdata = links_preprocessing(data, linkstodrop, duplicatelinks)
+		# The links are not identified by a single attribute, so in incremental mode they are replaced as a whole
+		if incrementalingest:
+			dbmanager.db["links"].delete_many({})
+		dbmanager.add_data("links", validdata)
+
+	# Create the indexes of the database, and check that the main queries use them
+	print("Creating indexes")
+	dbmanager.create_indexes()
+	dbmanager.check_query_plans()
+
+	dbmanager.set_checkpoint('Ingest', snapshot)
+
+
+if __name__ == "__main__":
+
+	# Connect to database
+	dbmanager = DBManager(dbpath)
+
+	# Find snapshots
+	snapshots = [filename for filename in os.listdir(datasetpath) if filename.startswith("snapshot")]
+
+	snapshotpath = os.path.join(datasetpath, snapshot)
+
+	# If the snapshot was loaded by a previous run, that was interrupted while downloading, resume the download
+	if dbmanager.get_checkpoint('Ingest') == snapshot:
+		print("\n" + snapshot + " already loaded, resuming the download")
+	else:
+		print("\nLoading " + snapshot)
+		with metrics.time('ingest'):
+			ingest_snapshot()
+
+	# Store the annotation category of each annotated commit to the commits collection
+	with open('annotations.txt', 'r') as file:
+		annotations = json.load(file)
+	annotated = dbmanager.add_annotations(annotations)
+	print(f"Annotated commits: {annotated}/{len(annotations)}")
+
+	# Enrich commits collection with commit content (only the commits that still lack it, e.g. after an interrupted run)
+	print("Downloading commits content")
+	commitdocuments = list(dbmanager.db["commits"].find({'CommitContent': {'$exists': False}}, {'RepoName': True, 'Sha': True, 'NumericID': True}))
+	commitcache = ResponseCache(commitcachepath) if commitcachepath else None
+
+	# Write each commit's content as soon as it is downloaded, in batches
+	commitswriter = dbmanager.bulk_writer("commits", batch_size=100)
+	with metrics.time('download'):
+		downloaded = download_commits_content(commitdocuments, commitswriter, int(downloadworkers) if downloadworkers else 8, commitcache, commitcacherevalidate)
+
+	if downloaded == -1: # Some API call failed
+		print('Download failed, run again to resume the download of the remaining commits')
+	else:
+		# The snapshot is complete, so a later run loads it again
+		dbmanager.clear_checkpoint('Ingest')
+
+	# Export the metrics of the run
+	if metricspath:
+		print("Metrics written to " + ", ".join(metrics.export(metricspath, 'populatedb')))
+
+	# Close the DB connection
+	dbmanager.close()
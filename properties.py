@@ -4,6 +4,13 @@ from dotenv import load_dotenv
 # Load the stored environment variables
 load_dotenv()
 
+def get_flag(name):
+	"""
+	Returns (True) if the environment variable of an optional feature is set to enable it ("1", "true" or "yes").
+	Any other value, e.g. "0", or an unset variable disables the feature.
+	"""
+	return os.getenv(name, "").strip().lower() in ("1", "true", "yes")
+
 dbpath = os.getenv("DBPATH")
 datasetpath = os.getenv("DATASETPATH")
 githubapikey = os.getenv("GITHUBAPIKEY")
@@ -11,4 +18,19 @@ snapshot = os.getenv("WORKINGSNAPSHOT")
 pmd = os.getenv("PMDPATH")
 java = os.getenv("JAVAPATH")
 simian = os.getenv("SIMIANPATH")
-resultspath = os.getenv("RESULTSPATH")
\ No newline at end of file
+resultspath = os.getenv("RESULTSPATH")
+ingestchunksize = os.getenv("INGESTCHUNKSIZE")
+preprocessingworkers = os.getenv("PREPROCESSINGWORKERS")
+incrementalingest = get_flag("INCREMENTALINGEST")
+downloadworkers = os.getenv("DOWNLOADWORKERS")
+commitcachepath = os.getenv("COMMITCACHEPATH")
+commitcacherevalidate = get_flag("COMMITCACHEREVALIDATE")
+clonedetection = os.getenv("CLONEDETECTION", "simian")
+qualityanalysis = os.getenv("QUALITYANALYSIS", "pmd")
+clonecachesize = os.getenv("CLONECACHESIZE")
+violationcachesize = os.getenv("VIOLATIONCACHESIZE")
+analysisworkers = os.getenv("ANALYSISWORKERS")
+resultstablespath = os.getenv("RESULTSTABLESPATH")
+metricspath = os.getenv("METRICSPATH")
+metricspercommit = get_flag("METRICSPERCOMMIT")
+languagetablepath = os.getenv("LANGUAGETABLEPATH")
\ No newline at end of file